@@ -0,0 +1,149 @@
+"""
+Prompt assembly for bot replies.
+
+A prompt is the system prompt, the chat's rolling summary, dataset schemas and the
+indexed passages closest to the latest message (see ``retrieval``), and the most
+recent messages, trimmed to ``CHAT_CONTEXT_TOKENS``. Messages that fall out of the recent window are
+folded into ``Chat.summary`` ``CHAT_SUMMARY_BATCH`` at a time after a reply has been
+sent (``fold_due``), so the prompt stays bounded however long the chat gets and building
+it never waits for a model call.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from files.models import FileUpload
+from llm.service import get_service
+from retrieval.index import search
+
+from .models import Chat, Message
+
+SYSTEM_PROMPT = (
+    'You are DataWhiz, an assistant that analyses the documents and datasets users upload '
+    'and answers with concise, well-formatted insights.'
+)
+
+SUMMARY_PROMPT = (
+    'You maintain a running summary of a conversation between a user and DataWhiz. '
+    'Update the summary with the new messages. Keep facts, figures, file names, decisions '
+    'and open questions, stay under 200 words, and reply with the summary only.'
+)
+
+SUMMARY_MESSAGE_CHARS = 2000
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token); good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def as_prompt(message):
+    return {'role': 'assistant' if message.sender == 'bot' else 'user', 'content': message.content}
+
+
+def after(created_at, pk):
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+
+def before(created_at, pk):
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+
+async def recent_messages(chat):
+    """The last ``CHAT_STREAM_HISTORY`` messages, oldest first."""
+    recent = Message.objects.filter(chat=chat).order_by('-created_at', '-id')[:settings.CHAT_STREAM_HISTORY]
+    return [message async for message in recent][::-1]
+
+
+async def unsummarised(chat, first):
+    """Up to a batch of the oldest messages before ``first`` not yet folded into the summary."""
+    backlog = Message.objects.filter(before(first.created_at, first.pk), chat=chat)
+    if chat.summary_upto_at:
+        backlog = backlog.filter(after(chat.summary_upto_at, chat.summary_upto_pk))
+    return [message async for message in backlog.order_by('created_at', 'id')[:settings.CHAT_SUMMARY_BATCH]]
+
+
+async def fold(chat, messages):
+    """Merge ``messages`` into the chat's summary and move the summary position past them."""
+    transcript = '\n'.join(
+        f"{as_prompt(message)['role']}: {message.content[:SUMMARY_MESSAGE_CHARS]}" for message in messages
+    )
+    prompt = [
+        {'role': 'system', 'content': SUMMARY_PROMPT},
+        {'role': 'user', 'content': f'Summary so far:\n{chat.summary or "(none)"}\n\nNew messages:\n{transcript}'},
+    ]
+    summary = await get_service().acomplete(prompt)
+    last = messages[-1]
+    # Another reply may have folded the same messages meanwhile; keep whichever landed first.
+    updated = await Chat.objects.filter(
+        pk=chat.pk, summary_upto_at=chat.summary_upto_at, summary_upto_pk=chat.summary_upto_pk,
+    ).aupdate(summary=summary, summary_upto_at=last.created_at, summary_upto_pk=last.pk)
+    if updated:
+        chat.summary = summary
+        chat.summary_upto_at, chat.summary_upto_pk = last.created_at, last.pk
+
+
+async def fold_due(chat):
+    """Fold the unsummarised messages before the recent window once a full batch has built up."""
+    recent = await recent_messages(chat)
+    if not recent:
+        return
+    backlog = await unsummarised(chat, recent[0])
+    if len(backlog) == settings.CHAT_SUMMARY_BATCH:
+        await fold(chat, backlog)
+
+
+async def history(chat):
+    """Return the messages to send verbatim, oldest first: unsummarised older ones and the recent window."""
+    recent = await recent_messages(chat)
+    if not recent:
+        return []
+    return await unsummarised(chat, recent[0]) + recent
+
+
+async def snippets(chat, query, budget):
+    """Dataset schemas and the indexed passages most similar to ``query``, within ``budget`` tokens."""
+    picked = []
+    used = 0
+
+    def take(text):
+        nonlocal used
+        cost = estimate_tokens(text)
+        if used + cost > budget:
+            return
+        picked.append(text)
+        used += cost
+
+    uploads = FileUpload.objects.filter(chat=chat, user=chat.user_id, schema__isnull=False).order_by('-uploaded_at')
+    async for upload in uploads:
+        columns = ', '.join(f"{column['name']} ({column['type']})" for column in upload.schema)
+        take(f'[{upload.filename}] {upload.row_count} rows; columns: {columns}')
+
+    hits = (await sync_to_async(search)(chat.pk, [query]))[0] if query else []
+    for chunk, score in hits:
+        take(f'[{chunk.source}] {chunk.text}')
+    return picked
+
+
+async def build_context(chat):
+    """Return the prompt messages for the next bot reply in ``chat``."""
+    messages = await history(chat)
+    query = messages[-1].content if messages else ''
+    system = [SYSTEM_PROMPT]
+    if chat.summary:
+        system.append(f'Summary of the earlier conversation:\n{chat.summary}')
+    found = await snippets(chat, query, settings.CHAT_CONTEXT_SNIPPET_TOKENS)
+    if found:
+        system.append('Excerpts from the files in this chat:\n' + '\n'.join(found))
+    system = '\n\n'.join(system)
+
+    # Drop the oldest messages until the prompt fits, always keeping the latest one.
+    budget = settings.CHAT_CONTEXT_TOKENS - estimate_tokens(system)
+    kept = []
+    for message in reversed(messages):
+        cost = estimate_tokens(message.content)
+        if kept and cost > budget:
+            break
+        kept.append(as_prompt(message))
+        budget -= cost
+    return [{'role': 'system', 'content': system}] + kept[::-1]
@@ -1,12 +1,53 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Substr
 from django.conf import settings
 
 # Create your models here.
 
+# Text search configuration of the stored search vectors; changing it needs a migration.
+SEARCH_CONFIG = 'english'
+
+def count_per_chat(queryset):
+    counts = queryset.filter(chat=OuterRef('pk')).order_by().values('chat').annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts), 0)
+
+class ChatQuerySet(models.QuerySet):
+    def with_activity(self):
+        """
+        Annotate each chat with its last message snippet, last activity time, message count
+        and file count using correlated subqueries, so a page of chats is a single query.
+        """
+        from files.models import FileUpload
+
+        last_message = Message.objects.filter(chat=OuterRef('pk')).order_by('-created_at', '-id')
+        return self.annotate(
+            last_message=Subquery(last_message.annotate(snippet=Substr('content', 1, 120)).values('snippet')[:1]),
+            last_message_sender=Subquery(last_message.values('sender')[:1]),
+            last_activity=Coalesce(Subquery(last_message.values('created_at')[:1]), 'created_at'),
+            message_count=count_per_chat(Message.objects.all()),
+            file_count=count_per_chat(FileUpload.objects.filter(user=OuterRef('user'))),
+        )
+
 class Chat(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chats')
     title = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Rolling summary of the conversation up to and including the message at
+    # (summary_upto_at, summary_upto_pk); kept as plain values so deleting that message
+    # does not reset it (see chat.context)
+    summary = models.TextField(blank=True, default='')
+    summary_upto_at = models.DateTimeField(null=True, blank=True)
+    summary_upto_pk = models.BigIntegerField(null=True, blank=True)
+
+    objects = ChatQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='chat_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.user.email})"
@@ -17,6 +58,17 @@ class Message(models.Model):
     content = models.TextField()
     sender = models.CharField(max_length=10, choices=[('user', 'User'), ('bot', 'Bot')])
     created_at = models.DateTimeField(auto_now_add=True)
+    search_vector = models.GeneratedField(
+        expression=SearchVector('content', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat', 'created_at', 'id'], name='message_chat_created_idx'),
+            GinIndex(fields=['search_vector'], name='message_search_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender}: {self.content[:30]}..."
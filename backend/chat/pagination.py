@@ -0,0 +1,130 @@
+"""
+Keyset pagination for chats and messages.
+
+Queries are built separately from their evaluation so the sync DRF views and the async
+views in ``chat.views`` page through the same ``(timestamp, id)`` index ranges.
+"""
+import base64
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+def encode_cursor(obj, field='created_at'):
+    raw = f'{getattr(obj, field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        timestamp = None
+    if timestamp is None:
+        raise NotFound('Invalid cursor')
+    return timestamp, pk
+
+
+def page_size(query_params, default, maximum, param='limit'):
+    try:
+        return max(min(int(query_params.get(param, default)), maximum), 1)
+    except ValueError:
+        return default
+
+
+def message_page_query(queryset, before=None, after=None, limit=50):
+    """
+    Return ``(queryset, newest_first)`` for one page of messages.
+
+    With ``after`` the page starts right after that cursor; otherwise it ends right
+    before ``before`` (or at the newest message). Filtering on ``(created_at, id)``
+    keeps every page an index range scan, however deep into the history it is.
+    """
+    if after:
+        created_at, pk = decode_cursor(after)
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        return queryset.order_by('created_at', 'id')[:limit], False
+    if before:
+        created_at, pk = decode_cursor(before)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    return queryset.order_by('-created_at', '-id')[:limit + 1], True
+
+
+def message_page(messages, newest_first, limit, after=None):
+    """
+    Turn the evaluated ``message_page_query`` into ``(messages, before, after)``: the page
+    in chronological order, the cursor for older messages (None at the start of the
+    chat) and the cursor of the newest message returned, for fetching newer ones.
+    """
+    if newest_first:
+        has_older = len(messages) > limit
+        messages = messages[:limit][::-1]
+    else:
+        has_older = True
+    before = encode_cursor(messages[0]) if messages and has_older else None
+    after = encode_cursor(messages[-1]) if messages else after
+    return messages, before, after
+
+
+def chat_page_query(queryset, cursor=None, limit=30):
+    """One page of chats annotated by ``with_activity``, most recently active first."""
+    if cursor:
+        last_activity, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(last_activity__lt=last_activity) | Q(last_activity=last_activity, id__lt=pk))
+    return queryset.order_by('-last_activity', '-id')[:limit + 1]
+
+
+def chat_page(chats, limit):
+    """Return ``(chats, next_cursor)`` for an evaluated ``chat_page_query``."""
+    next_cursor = encode_cursor(chats[limit - 1], 'last_activity') if len(chats) > limit else None
+    return chats[:limit], next_cursor
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination for chat history.
+
+    The default page is the newest ``limit`` messages. ``before`` holds the cursor for
+    the next older page (null at the start of the chat); ``after`` is the cursor of the
+    newest message returned, for fetching or polling newer messages.
+    """
+    page_size = 50
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit = page_size(request.query_params, self.page_size, self.max_page_size)
+        after = request.query_params.get('after')
+        queryset, newest_first = message_page_query(queryset, request.query_params.get('before'), after, limit)
+        messages, self.before, self.after = message_page(list(queryset), newest_first, limit, after)
+        return messages
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('before', self.before),
+            ('after', self.after),
+            ('results', data),
+        ]))
+
+
+class ChatCursorPagination(BasePagination):
+    """Chats by last activity; pass ``next`` back as ``cursor`` for the following page."""
+    page_size = 30
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit = page_size(request.query_params, self.page_size, self.max_page_size, param='page_size')
+        queryset = chat_page_query(queryset, request.query_params.get('cursor'), limit)
+        chats, self.next = chat_page(list(queryset), limit)
+        return chats
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next),
+            ('results', data),
+        ]))
@@ -8,6 +8,16 @@ class ChatSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'title', 'created_at']
         read_only_fields = ['id', 'user', 'created_at']
 
+class ChatListSerializer(ChatSerializer):
+    last_message = serializers.CharField(read_only=True)
+    last_message_sender = serializers.CharField(read_only=True)
+    last_activity = serializers.DateTimeField(read_only=True)
+    message_count = serializers.IntegerField(read_only=True)
+    file_count = serializers.IntegerField(read_only=True)
+
+    class Meta(ChatSerializer.Meta):
+        fields = ChatSerializer.Meta.fields + ['last_message', 'last_message_sender', 'last_activity', 'message_count', 'file_count']
+
 class MessageSerializer(serializers.ModelSerializer):
     files = FileUploadSerializer(many=True, read_only=True)
     class Meta:
@@ -0,0 +1,56 @@
+"""
+Server-Sent Events streaming of bot replies.
+
+Tokens are forwarded to the client as ``token`` events as soon as the model produces
+them; the complete reply is saved as a single bot Message at the end and sent as a
+``done`` event, after which older messages may be folded into the chat summary.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from files.models import FileUpload
+from llm.service import get_service
+from ocr.models import OCRDocument
+
+from .context import build_context, fold_due
+from .models import Message
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def file_hashes(chat):
+    """Content hashes of the files and documents attached to ``chat``, for the reply cache."""
+    hashes = []
+    for model in (FileUpload, OCRDocument):
+        rows = model.objects.filter(chat=chat, user=chat.user_id, content_hash__isnull=False).values_list('content_hash', flat=True)
+        hashes += [content_hash async for content_hash in rows]
+    return hashes
+
+
+async def reply_events(chat):
+    parts = []
+    try:
+        messages = await build_context(chat)
+        async for token in get_service().astream(messages, file_hashes=await file_hashes(chat)):
+            parts.append(token)
+            yield sse('token', {'text': token})
+    except Exception:
+        logger.exception('Streaming a reply for chat %s failed', chat.pk)
+        yield sse('error', {'error': 'The assistant failed to respond.'})
+        return
+    message = await Message.objects.acreate(chat=chat, content=''.join(parts), sender='bot')
+    data = await sync_to_async(lambda: MessageSerializer(message).data)()
+    yield sse('done', data)
+    # Summarising happens after the reply is out, so it never delays the first token.
+    try:
+        await fold_due(chat)
+    except Exception:
+        logger.exception('Summarising chat %s failed', chat.pk)
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from files.models import FileUpload
+from users.models import User
+
+from . import context
+from .streaming import reply_events
+from .models import Chat, Message
+from .views import AsyncChatListView, AsyncMessageListView
+
+INDEX_DIR = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(INDEX_DIR, ignore_errors=True)
+
+
+@override_settings(CHAT_STREAM_HISTORY=2, CHAT_SUMMARY_BATCH=2, EMBEDDINGS_INDEX_DIR=INDEX_DIR)
+class SummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.chat = Chat.objects.create(user=self.user, title='c')
+        self.messages = [
+            Message.objects.create(chat=self.chat, content=f'm{i}', sender='user' if i % 2 else 'bot')
+            for i in range(5)
+        ]
+        self.service = mock.Mock()
+        self.service.acomplete = mock.AsyncMock(return_value='summary')
+        patcher = mock.patch('chat.context.get_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def contents(self):
+        return [message.content for message in await context.history(self.chat)]
+
+    async def test_building_a_prompt_never_calls_the_model(self):
+        prompt = await context.build_context(self.chat)
+        self.service.acomplete.assert_not_called()
+        self.assertEqual([m['content'] for m in prompt[1:]], ['m0', 'm1', 'm3', 'm4'])
+
+    async def test_fold_due_folds_a_full_batch(self):
+        await context.fold_due(self.chat)
+        self.service.acomplete.assert_awaited_once()
+        await self.chat.arefresh_from_db()
+        self.assertEqual(self.chat.summary, 'summary')
+        self.assertEqual(self.chat.summary_upto_pk, self.messages[1].pk)
+        self.assertEqual(await self.contents(), ['m2', 'm3', 'm4'])
+
+    async def test_fold_due_waits_for_a_full_batch(self):
+        await Message.objects.filter(pk__in=[self.messages[0].pk, self.messages[1].pk]).adelete()
+        await context.fold_due(self.chat)
+        self.service.acomplete.assert_not_called()
+
+    async def test_deleting_the_last_summarised_message_keeps_the_position(self):
+        await context.fold_due(self.chat)
+        await Message.objects.filter(pk=self.messages[1].pk).adelete()
+        await self.chat.arefresh_from_db()
+        self.assertEqual(await self.contents(), ['m2', 'm3', 'm4'])
+
+    async def test_reply_is_sent_before_folding(self):
+        events = []
+        with mock.patch('chat.streaming.fold_due', side_effect=lambda chat: events.append('fold')):
+            async for event in reply_events(self.chat):
+                events.append(event.split('\n', 1)[0])
+        self.assertEqual(events[-2:], ['event: done', 'fold'])
+        self.assertIn('event: token', events)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pages(self, url, cursor_param, next_key, **params):
+        """Follow ``next_key`` cursors from the first page and return each page's ids."""
+        pages = []
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            if response.data[next_key] is None:
+                return pages, response.data
+            params[cursor_param] = response.data[next_key]
+
+    def test_message_cursors_round_trip(self):
+        chat = Chat.objects.create(user=self.user, title='c')
+        ids = [Message.objects.create(chat=chat, content=f'm{i}', sender='user').pk for i in range(5)]
+        # Ties on created_at are broken by id.
+        Message.objects.filter(pk__in=ids[1:4]).update(created_at=Message.objects.get(pk=ids[1]).created_at)
+        url = f'/api/chat/chats/{chat.pk}/messages/'
+        pages, _ = self.pages(url, 'before', 'before', limit=2)
+        self.assertEqual(pages, [ids[3:5], ids[1:3], ids[0:1]])
+
+        first = self.client.get(url, {'limit': 2}).data
+        older = self.client.get(url, {'limit': 2, 'before': first['before']}).data
+        newer = self.client.get(url, {'limit': 2, 'after': older['after']}).data
+        self.assertEqual([m['id'] for m in newer['results']], ids[3:5])
+        polled = self.client.get(url, {'after': newer['after']}).data
+        self.assertEqual((polled['results'], polled['after']), ([], newer['after']))
+
+    def test_chat_cursors_round_trip(self):
+        chats = [Chat.objects.create(user=self.user, title=f'c{i}') for i in range(5)]
+        Message.objects.create(chat=chats[0], content='latest', sender='user')
+        Chat.objects.filter(pk__in=[c.pk for c in chats[1:4]]).update(created_at=timezone.now() - timezone.timedelta(days=1))
+        pages, _ = self.pages('/api/chat/chats/', 'cursor', 'next', page_size=2)
+        order = [chats[0].pk, chats[4].pk, chats[3].pk, chats[2].pk, chats[1].pk]
+        self.assertEqual(pages, [order[0:2], order[2:4], order[4:5]])
+
+    def test_malformed_cursor_is_not_found(self):
+        chat = Chat.objects.create(user=self.user, title='c')
+        self.assertEqual(self.client.get(f'/api/chat/chats/{chat.pk}/messages/', {'before': 'nope'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/chat/chats/', {'cursor': 'bm9wZQ=='}).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=INDEX_DIR)
+class MessageOwnerTests(TestCase):
+    def test_posting_into_another_users_chat_is_not_found(self):
+        theirs = Chat.objects.create(user=User.objects.create_user('bob@example.com', 'pw'), title='theirs')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('ann@example.com', 'pw'))
+        response = client.post(f'/api/chat/chats/{theirs.pk}/messages/', {
+            'content': 'hi', 'files': SimpleUploadedFile('d.csv', b'a,b\n1,2\n'),
+        })
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(FileUpload.objects.exists())
+
+
+async def tokens(*parts):
+    for part in parts:
+        yield part
+
+
+@override_settings(EMBEDDINGS_INDEX_DIR=INDEX_DIR)
+class StreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.chat = Chat.objects.create(user=self.user, title='c')
+        self.client = AsyncClient()
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.url = f'/api/chat/chats/{self.chat.pk}/stream/'
+        self.service = mock.Mock()
+        self.service.astream = mock.Mock(side_effect=lambda *args, **kwargs: tokens('Hel', 'lo'))
+        patcher = mock.patch('chat.streaming.get_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def events(self, response):
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return [block.split('\n', 1) for block in body.strip().split('\n\n')]
+
+    async def test_reply_is_streamed_and_saved_once(self):
+        with mock.patch('chat.streaming.fold_due'):
+            response = await self.client.post(
+                self.url, {'content': 'hi'}, content_type='application/json', headers=self.auth,
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            events = await self.events(response)
+        self.assertEqual([event for event, _ in events], ['event: token', 'event: token', 'event: done'])
+        self.assertEqual(events[0][1], 'data: {"text": "Hel"}')
+        self.assertIn('"content": "Hello"', events[-1][1])
+        messages = [(m.sender, m.content) async for m in Message.objects.filter(chat=self.chat).order_by('id')]
+        self.assertEqual(messages, [('user', 'hi'), ('bot', 'Hello')])
+
+    async def test_requires_a_bearer_token(self):
+        response = await self.client.post(self.url, {'content': 'hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(await Message.objects.aexists())
+
+    async def test_other_users_chat_is_not_found(self):
+        theirs = await Chat.objects.acreate(user=await User.objects.acreate(email='bob@example.com'), title='theirs')
+        response = await self.client.post(
+            f'/api/chat/chats/{theirs.pk}/stream/', {'content': 'hi'}, content_type='application/json', headers=self.auth,
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(await Message.objects.aexists())
+        self.service.astream.assert_not_called()
+
+
+def async_get(view, path, params=None, user=None, **kwargs):
+    """GET ``path`` from an async read view, which ``ASYNC_READ_VIEWS`` would route it to."""
+    headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'} if user else {}
+    request = AsyncRequestFactory().get(path, params or {}, headers=headers)
+    response = async_to_sync(view.as_view())(request, **kwargs)
+    return response.status_code, json.loads(response.content)
+
+
+@override_settings(MEDIA_ROOT=INDEX_DIR)
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.chats = [Chat.objects.create(user=self.user, title=f'c{i}') for i in range(3)]
+        chat = self.chats[0]
+        for i in range(3):
+            Message.objects.create(chat=chat, user=self.user, content=f'm{i}', sender='user')
+        response = self.client.post(f'/api/chat/chats/{chat.pk}/messages/', {
+            'content': 'with a file', 'files': SimpleUploadedFile('d.csv', b'a\n1\n'),
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def test_chat_list_matches_the_drf_view(self):
+        path = '/api/chat/chats/'
+        for params in ({}, {'page_size': 2}):
+            with self.subTest(params=params):
+                expected = self.client.get(path, params).json()
+                self.assertEqual(async_get(AsyncChatListView, path, params, self.user), (200, expected))
+        cursor = self.client.get(path, {'page_size': 2}).json()['next']
+        params = {'page_size': 2, 'cursor': cursor}
+        self.assertEqual(async_get(AsyncChatListView, path, params, self.user), (200, self.client.get(path, params).json()))
+
+    def test_message_list_matches_the_drf_view(self):
+        chat_id = self.chats[0].pk
+        path = f'/api/chat/chats/{chat_id}/messages/'
+        first = self.client.get(path, {'limit': 2}).json()
+        for params in ({}, {'limit': 2}, {'limit': 2, 'before': first['before']}, {'after': first['before']}):
+            with self.subTest(params=params):
+                expected = self.client.get(path, params).json()
+                actual = async_get(AsyncMessageListView, path, params, self.user, chat_id=chat_id)
+                self.assertEqual(actual, (200, expected))
+
+    def test_authentication_and_bad_cursors(self):
+        self.assertEqual(async_get(AsyncChatListView, '/api/chat/chats/')[0], 401)
+        status, _ = async_get(AsyncChatListView, '/api/chat/chats/', {'cursor': 'nope'}, self.user)
+        self.assertEqual(status, 404)
+        other = User.objects.create_user('bob@example.com', 'pw')
+        chat_id = self.chats[0].pk
+        path = f'/api/chat/chats/{chat_id}/messages/'
+        self.assertEqual(async_get(AsyncMessageListView, path, user=other, chat_id=chat_id)[1]['results'], [])
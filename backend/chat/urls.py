@@ -1,9 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from .views import ChatListCreateView, ChatDeleteView, ChatUpdateView, MessageListCreateView
+from django.views.decorators.csrf import csrf_exempt
+from .views import (
+    ChatListCreateView, ChatDeleteView, ChatUpdateView, MessageListCreateView, ChatStreamView,
+    AsyncChatListView, AsyncMessageListView,
+)
+
+if settings.ASYNC_READ_VIEWS:
+    chat_list_view = csrf_exempt(AsyncChatListView.as_view())
+    message_list_view = csrf_exempt(AsyncMessageListView.as_view())
+else:
+    chat_list_view = ChatListCreateView.as_view()
+    message_list_view = MessageListCreateView.as_view()
 
 urlpatterns = [
-    path('chats/', ChatListCreateView.as_view(), name='chat-list-create'),
+    path('chats/', chat_list_view, name='chat-list-create'),
     path('chats/<int:pk>/', ChatDeleteView.as_view(), name='chat-delete'),
     path('chats/<int:pk>/rename/', ChatUpdateView.as_view(), name='chat-rename'),
-    path('chats/<int:chat_id>/messages/', MessageListCreateView.as_view(), name='message-list-create'),
+    path('chats/<int:chat_id>/messages/', message_list_view, name='message-list-create'),
+    path('chats/<int:chat_id>/stream/', csrf_exempt(ChatStreamView.as_view()), name='chat-stream'),
 ] 
\ No newline at end of file
@@ -1,20 +1,45 @@
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.views import View
 from rest_framework import generics, permissions
 from .models import Chat, Message
-from .serializers import ChatSerializer, MessageSerializer
-from files.models import FileUpload
+from .serializers import ChatSerializer, ChatListSerializer, MessageSerializer
+from .pagination import (
+    ChatCursorPagination, MessageCursorPagination, chat_page, chat_page_query, message_page, message_page_query, page_size,
+)
+from .streaming import reply_events
 from files.serializers import FileUploadSerializer
+from files import ingest
+from files.uploads import bulk_create_uploads, delete_stored, store_files
 from rest_framework.response import Response
 from rest_framework import status
+from users.authentication import aauthenticate
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import NotFound
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
 class ChatListCreateView(generics.ListCreateAPIView):
     serializer_class = ChatSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ChatCursorPagination
 
     def get_queryset(self):
-        return Chat.objects.filter(user=self.request.user).order_by('-created_at')
+        return Chat.objects.filter(user=self.request.user).with_activity()
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return ChatListSerializer
+        return ChatSerializer
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -38,16 +63,17 @@ class ChatUpdateView(generics.UpdateAPIView):
 class MessageListCreateView(generics.ListCreateAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         chat_id = self.kwargs['chat_id']
-        return Message.objects.filter(chat__id=chat_id, chat__user=self.request.user).order_by('created_at')
+        return Message.objects.filter(chat__id=chat_id, chat__user=self.request.user).prefetch_related('files')
 
     def post(self, request, *args, **kwargs):
-        print('DEBUG POST DATA:', request.data)
-        print('DEBUG POST FILES:', request.FILES)
+        started = time.monotonic()
         chat_id = self.kwargs['chat_id']
-        # Create the message first
+        if not Chat.objects.filter(pk=chat_id, user=request.user).exists():
+            return Response({'error': 'Chat not found.'}, status=status.HTTP_404_NOT_FOUND)
         message_serializer = MessageSerializer(data={
             'chat': chat_id,
             'user': request.user.id,
@@ -55,20 +81,112 @@ class MessageListCreateView(generics.ListCreateAPIView):
             'sender': request.data.get('sender', 'user'),
         })
         message_serializer.is_valid(raise_exception=True)
-        message = message_serializer.save(user=request.user, chat_id=chat_id)
 
-        # Handle file uploads (one or multiple)
+        # Handle file uploads (one or multiple): write them to storage in parallel first,
+        # then create the message and all FileUpload rows in one transaction.
         files = request.FILES.getlist('files') or request.FILES.getlist('file')
-        file_objs = []
-        for f in files:
-            file_obj = FileUpload.objects.create(
-                user=request.user,
-                chat_id=chat_id,
-                message=message,
-                file=f,
-                filename=f.name
-            )
-            file_objs.append(file_obj)
+        stored = store_files(files)
+        try:
+            with transaction.atomic():
+                message = message_serializer.save(user=request.user, chat_id=chat_id)
+                file_objs = bulk_create_uploads(files, stored, user=request.user, chat_id=chat_id, message=message)
+        except Exception:
+            delete_stored(stored)
+            raise
+        ingest.schedule(file_objs)
+
+        if random.random() < settings.CHAT_LOG_SAMPLE_RATE:
+            logger.info('message created', extra={
+                'chat_id': chat_id,
+                'message_id': message.id,
+                'user_id': request.user.id,
+                'file_count': len(files),
+                'upload_bytes': sum(f.size for f in files),
+                'duration_ms': round((time.monotonic() - started) * 1000),
+            })
         response_data = message_serializer.data
         response_data['files'] = FileUploadSerializer(file_objs, many=True).data
         return Response(response_data, status=status.HTTP_201_CREATED)
+
+class ChatStreamView(View):
+    """
+    Async endpoint that saves the user's message and streams the bot reply as
+    Server-Sent Events. Authenticates with the same JWT bearer token as the API.
+    """
+
+    async def post(self, request, chat_id):
+        user = await aauthenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        chat = await Chat.objects.filter(pk=chat_id, user=user).afirst()
+        if not chat:
+            return JsonResponse({'error': 'Chat not found.'}, status=404)
+        if request.content_type == 'application/json':
+            try:
+                content = json.loads(request.body or b'{}').get('content', '')
+            except (ValueError, AttributeError):
+                return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+        else:
+            content = request.POST.get('content', '')
+        if not content:
+            return JsonResponse({'error': 'No content provided.'}, status=400)
+        await Message.objects.acreate(chat=chat, user=user, content=content, sender='user')
+        response = StreamingHttpResponse(reply_events(chat), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+def delegate_to_sync(view_class):
+    """
+    An async view method that hands the request to a sync DRF view, for async views
+    that only implement some HTTP methods natively.
+    """
+    view = view_class.as_view()
+
+    def call(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    async def method(self, request, *args, **kwargs):
+        return await sync_to_async(call)(request, *args, **kwargs)
+
+    return method
+
+class AsyncChatListView(View):
+    """Async-ORM GET for the chat list (enabled by ASYNC_READ_VIEWS); POST uses ChatListCreateView."""
+    post = delegate_to_sync(ChatListCreateView)
+
+    async def get(self, request):
+        user = await aauthenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        pagination = ChatCursorPagination
+        limit = page_size(request.GET, pagination.page_size, pagination.max_page_size, param='page_size')
+        try:
+            queryset = chat_page_query(Chat.objects.filter(user=user).with_activity(), request.GET.get('cursor'), limit)
+        except NotFound as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=404)
+        chats, next_cursor = chat_page([chat async for chat in queryset], limit)
+        return JsonResponse({'next': next_cursor, 'results': ChatListSerializer(chats, many=True).data})
+
+class AsyncMessageListView(View):
+    """Async-ORM GET for chat history (enabled by ASYNC_READ_VIEWS); POST uses MessageListCreateView."""
+    post = delegate_to_sync(MessageListCreateView)
+
+    async def get(self, request, chat_id):
+        user = await aauthenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        pagination = MessageCursorPagination
+        limit = page_size(request.GET, pagination.page_size, pagination.max_page_size)
+        after = request.GET.get('after')
+        queryset = Message.objects.filter(chat__id=chat_id, chat__user=user).prefetch_related('files')
+        try:
+            queryset, newest_first = message_page_query(queryset, request.GET.get('before'), after, limit)
+        except NotFound as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=404)
+        messages, before, after = message_page([message async for message in queryset], newest_first, limit, after)
+        data = MessageSerializer(messages, many=True, context={'request': request}).data
+        return JsonResponse({'before': before, 'after': after, 'results': data})
@@ -2,6 +2,8 @@
 ASGI config for datawhiz_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn datawhiz_backend.asgi:application``) so the
+async streaming endpoints hold a connection without occupying a worker thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -42,12 +43,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'rest_framework',
     'users',
     'chat',
     'files',
     'ocr',
+    'search',
+    'retrieval',
 ]
 
 MIDDLEWARE = [
@@ -138,6 +142,44 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Storage
+# 'local' (MEDIA_ROOT), 's3' (any S3-compatible bucket, e.g. MinIO via AWS_S3_ENDPOINT_URL;
+# needs django-storages[s3]) or 'emulated' (files under MEDIA_ROOT that behave like a bucket:
+# no local paths, signed expiring download links served by /api/files/blobs/).
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+DEFAULT_STORAGE = {
+    'local': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    's3': {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.getenv('AWS_STORAGE_BUCKET_NAME', 'datawhiz'),
+            'endpoint_url': os.getenv('AWS_S3_ENDPOINT_URL') or None,
+            'access_key': os.getenv('AWS_ACCESS_KEY_ID'),
+            'secret_key': os.getenv('AWS_SECRET_ACCESS_KEY'),
+            'region_name': os.getenv('AWS_S3_REGION_NAME') or None,
+            'addressing_style': os.getenv('AWS_S3_ADDRESSING_STYLE', 'path'),
+            'file_overwrite': False,
+            'default_acl': None,
+            'querystring_auth': True,
+            'querystring_expire': int(os.getenv('FILES_DOWNLOAD_URL_EXPIRE', '300')),
+        },
+    },
+    'emulated': {'BACKEND': 'files.storage.EmulatedObjectStorage'},
+}[STORAGE_BACKEND]
+STORAGES = {
+    'default': DEFAULT_STORAGE,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Resumable uploads are assembled here before they are copied to a remote bucket.
+FILES_UPLOAD_STAGING_DIR = os.getenv('FILES_UPLOAD_STAGING_DIR', str(BASE_DIR / 'media' / 'staging'))
+# How file downloads are served: 'stream' (through Django), 'redirect' (presigned bucket URL; local
+# storage streams instead), 'accel' (nginx X-Accel-Redirect to an `internal` location at
+# FILES_ACCEL_REDIRECT_PREFIX + name) or 'sendfile' (Apache/lighttpd X-Sendfile; local storage only,
+# otherwise 'redirect').
+FILES_DOWNLOAD_MODE = os.getenv('FILES_DOWNLOAD_MODE', 'stream')
+FILES_DOWNLOAD_URL_EXPIRE = int(os.getenv('FILES_DOWNLOAD_URL_EXPIRE', '300'))
+FILES_ACCEL_REDIRECT_PREFIX = os.getenv('FILES_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -165,3 +207,116 @@ SIMPLE_JWT = {
 }
 
 AUTH_USER_MODEL = 'users.User'
+
+# Serve the chat list, message list and OCR-by-message reads from async views using the
+# async ORM (GET only; writes still go through the DRF views). Useful under ASGI.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Files
+# Threads used to write the files attached to a single message to storage.
+FILES_UPLOAD_THREADS = int(os.getenv('FILES_UPLOAD_THREADS', '8'))
+# Resumable uploads (/api/files/uploads/) may be at most this many bytes.
+FILES_CHUNKED_UPLOAD_MAX_SIZE = int(os.getenv('FILES_CHUNKED_UPLOAD_MAX_SIZE', str(5 * 1024 ** 3)))
+FILES_CHUNK_READ_SIZE = 1024 * 1024
+# Seconds a chunk upload may take before another request may take over the session.
+FILES_UPLOAD_CHUNK_TIMEOUT = int(os.getenv('FILES_UPLOAD_CHUNK_TIMEOUT', '3600'))
+# Resumable uploads left untouched this many seconds are removed by `python manage.py ingest_files`.
+FILES_UPLOAD_SESSION_EXPIRE = int(os.getenv('FILES_UPLOAD_SESSION_EXPIRE', str(24 * 3600)))
+# Tabular uploads are converted to Parquet (and indexed for retrieval) by `python manage.py ingest_files`;
+# set FILES_INGEST_ASYNC=False to do it inside the upload request instead.
+FILES_INGEST_ASYNC = os.getenv('FILES_INGEST_ASYNC', 'True') == 'True'
+# Seconds after which an upload stuck in `processing` is handed to another worker.
+FILES_INGEST_TIMEOUT = int(os.getenv('FILES_INGEST_TIMEOUT', '1800'))
+FILES_INGEST_BLOCK_SIZE = int(os.getenv('FILES_INGEST_BLOCK_SIZE', str(16 * 1024 * 1024)))
+# Dataset queries run in DuckDB and spill to FILES_QUERY_TEMP_DIR beyond the memory limit.
+FILES_QUERY_MEMORY_LIMIT = os.getenv('FILES_QUERY_MEMORY_LIMIT', '1GB')
+FILES_QUERY_THREADS = int(os.getenv('FILES_QUERY_THREADS', '2'))
+FILES_QUERY_TEMP_DIR = os.getenv('FILES_QUERY_TEMP_DIR', os.path.join(tempfile.gettempdir(), 'datawhiz-duckdb'))
+FILES_QUERY_MAX_ROWS = int(os.getenv('FILES_QUERY_MAX_ROWS', '10000'))
+FILES_PREVIEW_MAX_ROWS = int(os.getenv('FILES_PREVIEW_MAX_ROWS', '1000'))
+
+# Chat
+# Fraction of message-create requests that are logged.
+CHAT_LOG_SAMPLE_RATE = float(os.getenv('CHAT_LOG_SAMPLE_RATE', '0.1'))
+# Number of recent messages sent verbatim to the model with each streamed reply; older ones
+# are folded into the chat's rolling summary CHAT_SUMMARY_BATCH messages at a time.
+CHAT_STREAM_HISTORY = int(os.getenv('CHAT_STREAM_HISTORY', '20'))
+CHAT_SUMMARY_BATCH = int(os.getenv('CHAT_SUMMARY_BATCH', '10'))
+# Approximate token budget for a prompt, and the part of it reserved for document snippets.
+CHAT_CONTEXT_TOKENS = int(os.getenv('CHAT_CONTEXT_TOKENS', '6000'))
+CHAT_CONTEXT_SNIPPET_TOKENS = int(os.getenv('CHAT_CONTEXT_SNIPPET_TOKENS', '1500'))
+
+# Search
+# Hits per page and section of /api/search/.
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+
+# Embeddings
+# 'hash' (local feature hashing, no model needed), 'openai' or a dotted path to a retrieval.encoders.Encoder.
+EMBEDDINGS_ENCODER = os.getenv('EMBEDDINGS_ENCODER', 'hash')
+EMBEDDINGS_DIMENSIONS = int(os.getenv('EMBEDDINGS_DIMENSIONS', '512'))
+EMBEDDINGS_OPENAI_MODEL = os.getenv('EMBEDDINGS_OPENAI_MODEL', 'text-embedding-3-small')
+EMBEDDINGS_BATCH_SIZE = int(os.getenv('EMBEDDINGS_BATCH_SIZE', '64'))
+# Passages are about EMBEDDINGS_CHUNK_CHARS long and repeat up to EMBEDDINGS_CHUNK_OVERLAP of the previous one.
+EMBEDDINGS_CHUNK_CHARS = int(os.getenv('EMBEDDINGS_CHUNK_CHARS', '1000'))
+EMBEDDINGS_CHUNK_OVERLAP = int(os.getenv('EMBEDDINGS_CHUNK_OVERLAP', '200'))
+EMBEDDINGS_MAX_CHUNKS = int(os.getenv('EMBEDDINGS_MAX_CHUNKS', '5000'))
+EMBEDDINGS_MAX_FILE_ROWS = int(os.getenv('EMBEDDINGS_MAX_FILE_ROWS', '20000'))
+EMBEDDINGS_MAX_FILE_BYTES = int(os.getenv('EMBEDDINGS_MAX_FILE_BYTES', str(5 * 1024 * 1024)))
+# Per-chat vector matrices, memory-mapped at search time and scanned EMBEDDINGS_SEARCH_BLOCK rows at a time.
+EMBEDDINGS_INDEX_DIR = os.getenv('EMBEDDINGS_INDEX_DIR', str(BASE_DIR / 'embeddings'))
+EMBEDDINGS_SEARCH_BLOCK = int(os.getenv('EMBEDDINGS_SEARCH_BLOCK', '65536'))
+EMBEDDINGS_TOP_K = int(os.getenv('EMBEDDINGS_TOP_K', '8'))
+
+# OpenAI
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+
+# LLM
+# 'openai', 'stub' (deterministic offline replies) or a dotted path to an llm.providers.Provider.
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'openai' if OPENAI_API_KEY else 'stub')
+LLM_MODEL = os.getenv('LLM_MODEL', OPENAI_MODEL)
+# Provider calls allowed at once per event loop; identical requests in flight share one call.
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+# Seconds a reply stays cached for the same prompt, attached files and model.
+LLM_CACHE_TIMEOUT = int(os.getenv('LLM_CACHE_TIMEOUT', '3600'))
+
+# OCR
+# When enabled, uploads are queued and processed by `python manage.py ocr_worker`.
+OCR_ASYNC = os.getenv('OCR_ASYNC', 'False') == 'True'
+OCR_WORKER_PROCESSES = int(os.getenv('OCR_WORKER_PROCESSES', '2'))
+OCR_WORKER_POLL_INTERVAL = float(os.getenv('OCR_WORKER_POLL_INTERVAL', '1'))
+# Seconds after which a job stuck in `processing` is handed to another worker.
+OCR_JOB_TIMEOUT = int(os.getenv('OCR_JOB_TIMEOUT', '1800'))
+# 'auto' (tesserocr when installed, else pytesseract), 'tesserocr', 'pytesseract' or a dotted path
+# to an ocr.engines.Engine. tesserocr keeps OCR_ENGINE_THREADS Tesseract instances loaded per process.
+OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto')
+OCR_ENGINE_THREADS = int(os.getenv('OCR_ENGINE_THREADS', '1'))
+# Tesseract languages ('+'-separated, e.g. 'eng+deu') and page segmentation mode.
+OCR_LANGUAGES = os.getenv('OCR_LANGUAGES', 'eng')
+OCR_PAGE_SEG_MODE = int(os.getenv('OCR_PAGE_SEG_MODE', '3'))
+# PDFs are rasterized OCR_PDF_BATCH_PAGES pages at a time across OCR_PDF_PROCESSES processes.
+OCR_PDF_DPI = int(os.getenv('OCR_PDF_DPI', '200'))
+OCR_PDF_PROCESSES = int(os.getenv('OCR_PDF_PROCESSES', str(os.cpu_count() or 1)))
+OCR_PDF_BATCH_PAGES = int(os.getenv('OCR_PDF_BATCH_PAGES', '4'))
+OCR_PDF_MAX_PAGES = int(os.getenv('OCR_PDF_MAX_PAGES', '200'))
+# Use a PDF's embedded text layer when a page has at least OCR_PDF_TEXT_MIN_CHARS characters
+# and at least OCR_PDF_TEXT_MIN_QUALITY of them are readable; other pages are OCRed.
+OCR_PDF_TEXT_LAYER = os.getenv('OCR_PDF_TEXT_LAYER', 'True') == 'True'
+OCR_PDF_TEXT_MIN_CHARS = int(os.getenv('OCR_PDF_TEXT_MIN_CHARS', '20'))
+OCR_PDF_TEXT_MIN_QUALITY = float(os.getenv('OCR_PDF_TEXT_MIN_QUALITY', '0.8'))
+# Image clean-up before OCR (see ocr/preprocess.py); stages run in the order listed.
+# Available: downscale, orientation, grayscale, crop, deskew, binarize. An empty value disables it.
+OCR_PREPROCESS_STEPS = [
+    step.strip() for step in os.getenv('OCR_PREPROCESS_STEPS', 'downscale,orientation,grayscale,crop,deskew').split(',')
+    if step.strip()
+]
+# Images with more pixels than this are rejected before they are decoded.
+OCR_MAX_IMAGE_PIXELS = int(os.getenv('OCR_MAX_IMAGE_PIXELS', str(64_000_000)))
+OCR_PREPROCESS_MAX_SIDE = int(os.getenv('OCR_PREPROCESS_MAX_SIDE', '2500'))
+OCR_PREPROCESS_TARGET_DPI = int(os.getenv('OCR_PREPROCESS_TARGET_DPI', '300'))
+OCR_PREPROCESS_MAX_SKEW = float(os.getenv('OCR_PREPROCESS_MAX_SKEW', '5'))
+# Detect 90/180/270 degree rotation with Tesseract's OSD (needs the osd traineddata).
+OCR_PREPROCESS_OSD = os.getenv('OCR_PREPROCESS_OSD', 'False') == 'True'
+# Generated exports are cached on local disk up to OCR_EXPORT_CACHE_MAX_BYTES (LRU eviction).
+OCR_EXPORT_CACHE_DIR = os.getenv('OCR_EXPORT_CACHE_DIR', str(BASE_DIR / 'export_cache'))
+OCR_EXPORT_CACHE_MAX_BYTES = int(os.getenv('OCR_EXPORT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
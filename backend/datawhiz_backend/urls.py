@@ -25,6 +25,8 @@ urlpatterns = [
     path('api/chat/', include('chat.urls')),
     path('api/files/', include('files.urls')),
     path('api/ocr/', include('ocr.urls')),
+    path('api/search/', include('search.urls')),
+    path('api/retrieval/', include('retrieval.urls')),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,172 @@
+"""
+Columnar ingest of uploaded datasets.
+
+CSV, TSV, Excel and JSON uploads are converted once to zstd-compressed Parquet stored
+next to the original, and the schema, row count and per-column statistics are recorded
+on the FileUpload. CSV and NDJSON are converted in record batches, so memory use does
+not grow with the file size.
+"""
+import logging
+import math
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.json as pajson
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.core.files import File
+
+from .jobqueue import JobQueue
+from .models import FileUpload
+from .storage import field_path
+from .uploads import expire_sessions
+from ocr.extraction import get_extension
+from retrieval.index import index_source
+
+logger = logging.getLogger(__name__)
+
+DATA_EXTENSIONS = ['csv', 'tsv', 'xls', 'xlsx', 'json', 'ndjson', 'jsonl']
+
+
+def read_csv_batches(path, delimiter, as_strings=False):
+    read_options = pacsv.ReadOptions(block_size=settings.FILES_INGEST_BLOCK_SIZE)
+    parse_options = pacsv.ParseOptions(delimiter=delimiter)
+    convert_options = None
+    if as_strings:
+        with open(path, 'rb') as f:
+            names = pacsv.open_csv(f, read_options=read_options, parse_options=parse_options).schema.names
+        convert_options = pacsv.ConvertOptions(column_types={name: pa.string() for name in names})
+    return pacsv.open_csv(path, read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+
+
+def read_batches(path, ext, as_strings=False):
+    if ext in ('csv', 'tsv'):
+        return read_csv_batches(path, '\t' if ext == 'tsv' else ',', as_strings)
+    if ext in ('xls', 'xlsx'):
+        table = pa.Table.from_pandas(pd.read_excel(path), preserve_index=False)
+    else:
+        with open(path, 'rb') as f:
+            first = f.read(64).lstrip()[:1]
+        if first == b'[':
+            table = pa.Table.from_pandas(pd.read_json(path), preserve_index=False)
+        else:
+            table = pajson.read_json(path, read_options=pajson.ReadOptions(block_size=settings.FILES_INGEST_BLOCK_SIZE))
+    return pa.RecordBatchReader.from_batches(table.schema, table.to_batches())
+
+
+def jsonable(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class ColumnStats:
+    """Running null count, min, max and (for numeric columns) mean over record batches."""
+
+    def __init__(self, field):
+        self.type = field.type
+        self.numeric = pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+        self.null_count = 0
+        self.min = None
+        self.max = None
+        self.total = 0
+        self.count = 0
+
+    def update(self, column):
+        self.null_count += column.null_count
+        if column.null_count == len(column):
+            return
+        try:
+            bounds = pc.min_max(column)
+        except pa.ArrowNotImplementedError:
+            return
+        low, high = bounds['min'].as_py(), bounds['max'].as_py()
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        if self.numeric:
+            self.total += pc.sum(column).as_py()
+            self.count += len(column) - column.null_count
+
+    def as_dict(self):
+        stats = {'type': str(self.type), 'null_count': self.null_count, 'min': jsonable(self.min), 'max': jsonable(self.max)}
+        if self.numeric:
+            stats['mean'] = jsonable(self.total / self.count) if self.count else None
+        return stats
+
+
+def convert(path, ext, destination, as_strings=False):
+    """Write the dataset at ``path`` to Parquet at ``destination``; return ``(schema, rows, stats)``."""
+    reader = read_batches(path, ext, as_strings)
+    stats = [ColumnStats(field) for field in reader.schema]
+    rows = 0
+    with pq.ParquetWriter(destination, reader.schema, compression='zstd') as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            for column, column_stats in zip(batch.columns, stats):
+                column_stats.update(column)
+    schema = [{'name': field.name, 'type': str(field.type)} for field in reader.schema]
+    return schema, rows, {field.name: s.as_dict() for field, s in zip(reader.schema, stats)}
+
+
+def ingest(upload):
+    ext = get_extension(upload.filename or upload.file.name)
+    if ext not in DATA_EXTENSIONS:
+        upload.ingest_status = 'skipped'
+        upload.save(update_fields=['ingest_status'])
+        index_source(upload)
+        return
+    fd, tmp_path = tempfile.mkstemp(suffix='.parquet')
+    os.close(fd)
+    try:
+        with field_path(upload.file) as path:
+            try:
+                schema, rows, stats = convert(path, ext, tmp_path)
+            except pa.ArrowInvalid:
+                if ext not in ('csv', 'tsv'):
+                    raise
+                # Types inferred from the first block did not hold for the rest of the file.
+                schema, rows, stats = convert(path, ext, tmp_path, as_strings=True)
+        with open(tmp_path, 'rb') as f:
+            name = os.path.splitext(os.path.basename(upload.file.name))[0] + '.parquet'
+            upload.columnar_file.save(name, File(f), save=False)
+    except Exception as exc:
+        logger.exception('Ingest of file %s failed', upload.pk)
+        upload.ingest_status = 'failed'
+        upload.ingest_error = str(exc)
+        upload.save(update_fields=['ingest_status', 'ingest_error'])
+        return
+    finally:
+        os.unlink(tmp_path)
+    upload.ingest_status = 'done'
+    upload.ingest_error = None
+    upload.schema = schema
+    upload.row_count = rows
+    upload.column_stats = stats
+    upload.save(update_fields=['ingest_status', 'ingest_error', 'columnar_file', 'schema', 'row_count', 'column_stats'])
+    index_source(upload)
+
+
+def schedule(uploads):
+    """Ingest new uploads now, or leave them ``pending`` for ``manage.py ingest_files``."""
+    if settings.FILES_INGEST_ASYNC:
+        return
+    for upload in uploads:
+        ingest(upload)
+
+
+queue = JobQueue(FileUpload, 'ingest_status', 'ingest_started_at', 'uploaded_at', 'FILES_INGEST_TIMEOUT')
+claim_next = queue.claim_next
+requeue_stale = queue.requeue_stale
+
+
+def work(poll_interval, once=False):
+    requeue_stale()
+    expire_sessions()
+    queue.work(ingest, poll_interval, once, on_idle=expire_sessions)
@@ -0,0 +1,63 @@
+"""
+Database-backed job queues shared by the ``files`` and ``ocr`` workers.
+
+Rows waiting for work are marked ``pending`` in a status field. Workers claim the oldest
+one with ``SELECT ... FOR UPDATE SKIP LOCKED``, so several processes (or hosts) can share
+a queue without an external broker, and rows left ``processing`` by a worker that died
+are put back in the queue once their timeout has passed.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+
+class JobQueue:
+    def __init__(self, model, status_field, started_field, order_by, timeout_setting, reset=None):
+        self.model = model
+        self.status_field = status_field
+        self.started_field = started_field
+        self.order_by = order_by
+        self.timeout_setting = timeout_setting
+        # Extra field values written when a row is claimed.
+        self.reset = reset or {}
+
+    def claim_next(self):
+        with transaction.atomic():
+            obj = (
+                self.model.objects.select_for_update(skip_locked=True)
+                .filter(**{self.status_field: 'pending'})
+                .order_by(self.order_by)
+                .first()
+            )
+            if obj is None:
+                return None
+            values = {self.status_field: 'processing', self.started_field: timezone.now(), **self.reset}
+            for name, value in values.items():
+                setattr(obj, name, value)
+            obj.save(update_fields=list(values))
+        return obj
+
+    def requeue_stale(self):
+        """Put rows still ``processing`` after the queue's timeout setting back in the queue."""
+        cutoff = timezone.now() - timedelta(seconds=getattr(settings, self.timeout_setting))
+        return self.model.objects.filter(
+            **{self.status_field: 'processing', f'{self.started_field}__lt': cutoff}
+        ).update(**{self.status_field: 'pending'})
+
+    def work(self, handle, poll_interval, once=False, on_idle=None):
+        # Connections inherited from the parent process must not be shared.
+        connections.close_all()
+        while True:
+            obj = self.claim_next()
+            if obj is None:
+                if once:
+                    return
+                self.requeue_stale()
+                if on_idle is not None:
+                    on_idle()
+                time.sleep(poll_interval)
+                continue
+            handle(obj)
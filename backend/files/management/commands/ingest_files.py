@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from files.ingest import work
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert pending tabular uploads to Parquet and record their schema and statistics, '
+        'and remove abandoned resumable uploads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help='Exit once no uploads are pending.')
+
+    def handle(self, *args, **options):
+        work(options['poll_interval'], once=options['once'])
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='column_stats',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='columnar_file',
+            field=models.FileField(blank=True, null=True, upload_to='columnar/'),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='ingest_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='ingest_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed'), ('skipped', 'Skipped')], db_index=True, default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='row_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='schema',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,15 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:25
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_fileupload_content_hash'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ]
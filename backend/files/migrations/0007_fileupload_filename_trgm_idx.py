@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:25
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_search_vector'),
+        ('files', '0006_trigram_extension'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fileupload',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['filename'], name='file_filename_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_fileupload_filename_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='ingest_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0008_fileupload_ingest_started_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='chunk_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
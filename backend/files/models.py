@@ -1,3 +1,6 @@
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.conf import settings
 
@@ -10,6 +13,48 @@ class FileUpload(models.Model):
     file = models.FileField(upload_to='uploads/')
     filename = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # SHA-256 of the stored bytes, computed when the file is uploaded
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
+    # Parquet copy of tabular uploads, written by files.ingest
+    columnar_file = models.FileField(upload_to='columnar/', blank=True, null=True)
+    schema = models.JSONField(blank=True, null=True)
+    row_count = models.BigIntegerField(blank=True, null=True)
+    column_stats = models.JSONField(blank=True, null=True)
+    ingest_status = models.CharField(
+        max_length=20,
+        choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed'), ('skipped', 'Skipped')],
+        default='pending',
+        db_index=True,
+    )
+    ingest_error = models.TextField(blank=True, null=True)
+    ingest_started_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['filename'], opclasses=['gin_trgm_ops'], name='file_filename_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.filename
+
+class UploadSession(models.Model):
+    """A resumable upload whose chunks are appended straight to the final storage path."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    target = models.CharField(max_length=10, choices=[('file', 'File'), ('ocr', 'OCR')], default='file')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    checksum = models.CharField(max_length=64)
+    path = models.CharField(max_length=255)
+    offset = models.BigIntegerField(default=0)
+    # Set while a PUT is writing a chunk, so no other request writes or completes the upload meanwhile.
+    chunk_started_at = models.DateTimeField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=[('uploading', 'Uploading'), ('complete', 'Complete')], default='uploading')
+    chat = models.ForeignKey('chat.Chat', on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    message = models.ForeignKey('chat.Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    tags = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
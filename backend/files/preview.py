@@ -0,0 +1,136 @@
+"""
+Dataset previews that never parse the whole file.
+
+Delimited text and NDJSON are read with seeks: the head is the first lines of the file
+and the sample is built by jumping to random byte offsets and taking the line around
+each one. Other formats are previewed from their Parquet copy, reading only the footer,
+the first batch and the row groups the sample falls in. Files are opened with
+``open_ranged``, so with object storage only those byte ranges are fetched.
+"""
+import csv
+import json
+import os
+import random
+
+import pyarrow.parquet as pq
+
+from .ingest import get_extension
+from .storage import open_ranged
+
+DELIMITERS = {'csv': ',', 'tsv': '\t'}
+JSON_LINE_FORMATS = ['ndjson', 'jsonl']
+
+
+class PreviewUnavailable(ValueError):
+    pass
+
+
+BACKSCAN_SIZE = 4 * 1024
+
+
+def read_line(f, start):
+    """Return the line starting at byte ``start`` and the offset of the next one."""
+    f.seek(start)
+    raw = f.readline()
+    return raw.rstrip(b'\n').rstrip(b'\r').decode('utf-8', errors='replace'), start + len(raw)
+
+
+def line_start(f, offset, floor):
+    """Offset of the start of the line containing byte ``offset``, not before ``floor``."""
+    end = offset
+    while end > floor:
+        begin = max(end - BACKSCAN_SIZE, floor)
+        f.seek(begin)
+        newline = f.read(end - begin).rfind(b'\n')
+        if newline != -1:
+            return begin + newline + 1
+        end = begin
+    return floor
+
+
+def line_preview(f, rows, sample, has_header=True):
+    """
+    Return ``(header_line, head_lines, sample_lines)`` for the seekable binary file ``f``.
+    Each sampled line is the one containing a random byte offset, so longer lines are
+    proportionally more likely.
+    """
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        return None, [], []
+    header, data_start = read_line(f, 0) if has_header else (None, 0)
+    head, pos = [], data_start
+    while len(head) < rows and pos < size:
+        line, pos = read_line(f, pos)
+        head.append(line)
+    sampled = {}
+    attempts = 0
+    while len(sampled) < sample and data_start < size and attempts < sample * 4:
+        attempts += 1
+        start = line_start(f, random.randrange(data_start, size), data_start)
+        if start not in sampled:
+            sampled[start] = read_line(f, start)[0]
+    return header, head, [sampled[start] for start in sorted(sampled) if sampled[start].strip()]
+
+
+def parse_delimited(lines, delimiter):
+    return [row for row in csv.reader(lines, delimiter=delimiter)]
+
+
+def parse_json_lines(lines, columns):
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict):
+            records.append(record)
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    return [[record.get(column) for column in columns] for record in records]
+
+
+def parquet_preview(f, rows, sample):
+    parquet = pq.ParquetFile(f)
+    columns = parquet.schema_arrow.names
+    head = []
+    if rows:
+        batch = next(parquet.iter_batches(batch_size=rows), None)
+        if batch is not None:
+            head = [list(row.values()) for row in batch.to_pylist()]
+    total = parquet.metadata.num_rows
+    picked = sorted(random.sample(range(total), min(sample, total)))
+    sampled, group_start = [], 0
+    for group in range(parquet.num_row_groups):
+        group_rows = parquet.metadata.row_group(group).num_rows
+        indices = [i - group_start for i in picked if group_start <= i < group_start + group_rows]
+        if indices:
+            table = parquet.read_row_group(group).take(indices)
+            sampled += [list(row.values()) for row in table.to_pylist()]
+        group_start += group_rows
+    return columns, head, sampled
+
+
+def preview(upload, rows, sample):
+    ext = get_extension(upload.filename or upload.file.name)
+    if ext in DELIMITERS:
+        with open_ranged(upload.file) as f:
+            header, head, sampled = line_preview(f, rows, sample)
+        if header is None:
+            return {'columns': [], 'rows': [], 'sample': [], 'row_count': upload.row_count}
+        delimiter = DELIMITERS[ext]
+        columns = parse_delimited([header], delimiter)[0]
+        head, sampled = parse_delimited(head, delimiter), parse_delimited(sampled, delimiter)
+    elif ext in JSON_LINE_FORMATS:
+        columns = []
+        with open_ranged(upload.file) as f:
+            _, head, sampled = line_preview(f, rows, sample, has_header=False)
+        head, sampled = parse_json_lines(head, columns), parse_json_lines(sampled, columns)
+    elif upload.columnar_file:
+        with open_ranged(upload.columnar_file) as f:
+            columns, head, sampled = parquet_preview(f, rows, sample)
+    else:
+        raise PreviewUnavailable('Preview is available once the file has been ingested.')
+    return {'columns': columns, 'rows': head, 'sample': sampled, 'row_count': upload.row_count}
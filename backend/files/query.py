@@ -0,0 +1,186 @@
+"""
+Out-of-core queries over uploaded datasets.
+
+Queries are described as JSON (columns, filters, group-bys, aggregates, ordering) and
+compiled to SQL for an embedded DuckDB connection that reads the upload's Parquet copy,
+or the raw CSV/JSON file when it has not been ingested. A Parquet copy in a bucket is read
+with ranged requests, so a query only downloads the row groups and columns it needs;
+raw files there are still copied locally first. DuckDB streams the file and spills
+to ``FILES_QUERY_TEMP_DIR`` past ``FILES_QUERY_MEMORY_LIMIT``, so datasets larger than the
+worker's memory can still be filtered and aggregated. Example::
+
+    {
+        "group_by": ["region"],
+        "aggregates": [{"fn": "sum", "column": "revenue", "as": "total"}],
+        "filters": [{"column": "year", "op": "gte", "value": 2023}],
+        "order_by": [{"column": "total", "desc": true}],
+        "limit": 10
+    }
+"""
+from contextlib import contextmanager
+
+import duckdb
+import pyarrow as pa
+import pyarrow.dataset as ds
+from django.conf import settings
+
+from .ingest import get_extension
+from .storage import field_path, is_local, open_ranged
+
+AGGREGATES = {
+    'count': 'count({})',
+    'count_distinct': 'count(DISTINCT {})',
+    'sum': 'sum({})',
+    'avg': 'avg({})',
+    'min': 'min({})',
+    'max': 'max({})',
+}
+
+OPERATORS = {'eq': '=', 'ne': '<>', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>='}
+
+READERS = {
+    'csv': 'read_csv_auto',
+    'tsv': 'read_csv_auto',
+    'json': 'read_json_auto',
+    'ndjson': 'read_json_auto',
+    'jsonl': 'read_json_auto',
+}
+
+
+class QueryError(ValueError):
+    pass
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def quote_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def source(upload):
+    """Return the stored file to query and the DuckDB function that reads it."""
+    if upload.columnar_file:
+        return upload.columnar_file, 'read_parquet'
+    reader = READERS.get(get_extension(upload.filename or upload.file.name))
+    if not reader:
+        raise QueryError('This file has not been ingested and cannot be queried directly.')
+    return upload.file, reader
+
+
+@contextmanager
+def table_source(con, field_file, reader):
+    """Yield the FROM clause that reads ``field_file`` on ``con``."""
+    if reader == 'read_parquet' and not is_local(field_file.storage):
+        with open_ranged(field_file) as f:
+            parquet = ds.ParquetFileFormat()
+            fragment = parquet.make_fragment(pa.PythonFile(f, mode='r'))
+            con.register('dataset', ds.FileSystemDataset([fragment], fragment.physical_schema, parquet))
+            yield 'dataset'
+        return
+    with field_path(field_file) as path:
+        yield f'{reader}({quote_literal(path)})'
+
+
+def connect():
+    con = duckdb.connect()
+    con.execute(f'SET memory_limit = {quote_literal(settings.FILES_QUERY_MEMORY_LIMIT)}')
+    con.execute(f'SET temp_directory = {quote_literal(settings.FILES_QUERY_TEMP_DIR)}')
+    con.execute(f'SET threads = {int(settings.FILES_QUERY_THREADS)}')
+    return con
+
+
+def items(spec, key, kind):
+    """``spec[key]`` as a list whose items are all ``kind``, or ``[]`` when absent."""
+    value = spec.get(key)
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(item, kind) for item in value):
+        raise QueryError(f"{key} must be a list of {'objects' if kind is dict else 'column names'}.")
+    return value
+
+
+def build_sql(spec, table, columns):
+    """Compile a query spec to ``(sql, params)``, rejecting unknown columns and functions."""
+    def column(name):
+        if not isinstance(name, str) or name not in columns:
+            raise QueryError(f'Unknown column: {name}')
+        return quote_identifier(name)
+
+    group_by = items(spec, 'group_by', str)
+    aggregates = items(spec, 'aggregates', dict)
+    select = [column(name) for name in group_by]
+    aliases = set()
+    for agg in aggregates:
+        fn = agg.get('fn')
+        if not isinstance(fn, str) or fn not in AGGREGATES:
+            raise QueryError(f'Unsupported aggregate: {fn}')
+        target = '*' if fn == 'count' and agg.get('column') in (None, '*') else column(agg.get('column'))
+        alias = agg.get('as') or f"{fn}_{agg.get('column') or 'all'}"
+        if not isinstance(alias, str):
+            raise QueryError('Aggregate names must be strings.')
+        aliases.add(alias)
+        select.append(f'{AGGREGATES[fn].format(target)} AS {quote_identifier(alias)}')
+    if not aggregates:
+        select += [column(name) for name in items(spec, 'columns', str) if name not in group_by]
+    if not select:
+        select = ['*']
+
+    where, params = [], []
+    for condition in items(spec, 'filters', dict):
+        name, op, value = condition.get('column'), condition.get('op', 'eq'), condition.get('value')
+        if not isinstance(op, str):
+            raise QueryError(f'Unsupported operator: {op}')
+        if op == 'isnull':
+            where.append(f"{column(name)} IS {'' if value in (None, True) else 'NOT '}NULL")
+        elif op == 'in':
+            if not isinstance(value, list) or not value:
+                raise QueryError('The "in" operator expects a non-empty list.')
+            where.append(f"{column(name)} IN ({', '.join('?' for _ in value)})")
+            params += value
+        elif op == 'contains':
+            where.append(f'CAST({column(name)} AS VARCHAR) ILIKE ?')
+            params.append(f'%{value}%')
+        elif op in OPERATORS:
+            where.append(f'{column(name)} {OPERATORS[op]} ?')
+            params.append(value)
+        else:
+            raise QueryError(f'Unsupported operator: {op}')
+
+    sql = f"SELECT {', '.join(select)} FROM {table}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if group_by:
+        sql += ' GROUP BY ' + ', '.join(column(name) for name in group_by)
+    order = []
+    for item in items(spec, 'order_by', dict):
+        name = item.get('column')
+        target = quote_identifier(name) if isinstance(name, str) and name in aliases else column(name)
+        order.append(f"{target} {'DESC' if item.get('desc') else 'ASC'}")
+    if order:
+        sql += ' ORDER BY ' + ', '.join(order)
+    try:
+        limit = min(int(spec.get('limit', settings.FILES_QUERY_MAX_ROWS)), settings.FILES_QUERY_MAX_ROWS)
+    except (TypeError, ValueError):
+        raise QueryError('limit must be an integer.')
+    sql += f' LIMIT {max(limit, 0)}'
+    return sql, params
+
+
+def run_query(upload, spec):
+    field_file, reader = source(upload)
+    con = connect()
+    try:
+        with table_source(con, field_file, reader) as table:
+            columns = [row[0] for row in con.execute(f'DESCRIBE SELECT * FROM {table}').fetchall()]
+            sql, params = build_sql(spec, table, columns)
+            cursor = con.execute(sql, params)
+            return {
+                'columns': [description[0] for description in cursor.description],
+                'rows': cursor.fetchall(),
+            }
+    except duckdb.Error as exc:
+        raise QueryError(str(exc))
+    finally:
+        con.close()
@@ -1,8 +1,53 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import FileUpload
+from ocr.extraction import SUPPORTED_EXTENSIONS, get_extension
+from .models import FileUpload, UploadSession
+
+
+def validate_chat_owner(serializer, attrs):
+    """Reject a ``chat`` or ``message`` that does not belong to the requesting user."""
+    user = serializer.context['request'].user
+    chat, message = attrs.get('chat'), attrs.get('message')
+    if chat and chat.user_id != user.pk:
+        raise serializers.ValidationError({'chat': 'Chat not found.'})
+    if message and message.chat.user_id != user.pk:
+        raise serializers.ValidationError({'message': 'Message not found.'})
+    if chat and message and message.chat_id != chat.pk:
+        raise serializers.ValidationError({'message': 'Message is not in this chat.'})
+    return attrs
 
 class FileUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileUpload
-        fields = ['id', 'user', 'chat', 'message', 'file', 'filename', 'uploaded_at']
-        read_only_fields = ['id', 'user', 'uploaded_at'] 
\ No newline at end of file
+        fields = ['id', 'user', 'chat', 'message', 'file', 'filename', 'uploaded_at', 'ingest_status', 'row_count']
+        read_only_fields = ['id', 'user', 'uploaded_at', 'ingest_status', 'row_count']
+
+    def validate(self, attrs):
+        return validate_chat_owner(self, attrs)
+
+class FileUploadDetailSerializer(FileUploadSerializer):
+    class Meta(FileUploadSerializer.Meta):
+        fields = FileUploadSerializer.Meta.fields + ['schema', 'column_stats', 'ingest_error']
+        read_only_fields = fields 
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'target', 'filename', 'size', 'checksum', 'offset', 'status', 'chat', 'message', 'tags', 'created_at']
+        read_only_fields = ['id', 'offset', 'status', 'created_at']
+
+    def validate_size(self, value):
+        if value < 0 or value > settings.FILES_CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError('Unsupported upload size.')
+        return value
+
+    def validate_checksum(self, value):
+        value = value.lower()
+        if len(value) != 64 or any(ch not in '0123456789abcdef' for ch in value):
+            raise serializers.ValidationError('Expected a hex SHA-256 digest.')
+        return value
+
+    def validate(self, attrs):
+        if attrs.get('target') == 'ocr' and get_extension(attrs['filename']) not in SUPPORTED_EXTENSIONS:
+            raise serializers.ValidationError({'filename': 'Unsupported file type.'})
+        return validate_chat_owner(self, attrs)
@@ -0,0 +1,178 @@
+"""
+Storage helpers shared by the ``files`` and ``ocr`` apps.
+
+Uploads live in the default storage, which is local disk or an S3-compatible bucket
+(``STORAGE_BACKEND``). Code that needs a real file (DuckDB, pdf2image, Tesseract) goes
+through ``local_path``, which hands out the stored file itself on local disk and a
+temporary copy otherwise; code that reads only parts of a file uses ``open_ranged``,
+which fetches byte ranges from a bucket instead of the whole object. Downloads go through
+``download_response`` so that, outside of ``FILES_DOWNLOAD_MODE = 'stream'``, the web
+server or the bucket sends the bytes rather than a Django worker.
+"""
+import io
+import mimetypes
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage, Storage
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import content_disposition_header
+
+BLOB_SALT = 'files.blob'
+RANGE_READ_SIZE = 16 * 1024
+
+
+def is_local(storage):
+    try:
+        storage.path('')
+    except NotImplementedError:
+        return False
+    return True
+
+
+@contextmanager
+def local_path(storage, name):
+    """Yield a filesystem path holding the contents of ``name`` in ``storage``."""
+    if is_local(storage):
+        yield storage.path(name)
+        return
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+    try:
+        with os.fdopen(fd, 'wb') as out, storage.open(name, 'rb') as blob:
+            shutil.copyfileobj(blob, out, settings.FILES_CHUNK_READ_SIZE)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def field_path(field_file):
+    return local_path(field_file.storage, field_file.name)
+
+
+class RangedObject(io.RawIOBase):
+    """Seekable reads of a boto3 S3 ``Object``, each one a ranged GET."""
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.size = obj.content_length
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(base + offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        data = self.obj.get(Range=f'bytes={self.position}-{end - 1}')['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+@contextmanager
+def open_ranged(field_file):
+    """
+    Yield a seekable binary file for ``field_file`` that reads only what is asked for:
+    the stored file itself, or byte-range requests for django-storages' S3 files, which
+    would otherwise download the whole object on first read.
+    """
+    f = field_file.storage.open(field_file.name, 'rb')
+    try:
+        obj = getattr(f, 'obj', None)
+        yield f if obj is None else io.BufferedReader(RangedObject(obj), RANGE_READ_SIZE)
+    finally:
+        f.close()
+
+
+# Resumable uploads append to a local file; with remote storage they are staged here and
+# moved to the bucket in one upload when complete.
+staging_storage = SimpleLazyObject(lambda: FileSystemStorage(location=settings.FILES_UPLOAD_STAGING_DIR))
+
+
+def upload_storage(field):
+    return field.storage if is_local(field.storage) else staging_storage
+
+
+def download_response(field_file, filename):
+    """A response that makes the client download ``field_file`` as ``filename``."""
+    storage, name = field_file.storage, field_file.name
+    mode = settings.FILES_DOWNLOAD_MODE
+    disposition = content_disposition_header(True, filename)
+    if mode == 'sendfile' and not is_local(storage):
+        mode = 'redirect'
+    if mode == 'redirect' and is_local(storage):
+        # A MEDIA_URL link would be public and guessable, bypassing the caller's permission check.
+        mode = 'stream'
+    if mode == 'redirect':
+        return HttpResponseRedirect(storage.url(
+            name, parameters={'ResponseContentDisposition': disposition}, expire=settings.FILES_DOWNLOAD_URL_EXPIRE,
+        ))
+    if mode in ('accel', 'sendfile'):
+        response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response['Content-Disposition'] = disposition
+        if mode == 'accel':
+            response['X-Accel-Redirect'] = quote(settings.FILES_ACCEL_REDIRECT_PREFIX + name)
+        else:
+            response['X-Sendfile'] = storage.path(name)
+        return response
+    return FileResponse(field_file.open('rb'), as_attachment=True, filename=filename)
+
+
+class EmulatedObjectStorage(Storage):
+    """
+    Local stand-in for an S3-compatible bucket, for development and tests: files are kept
+    under MEDIA_ROOT, but like a bucket it has no ``path()`` and ``url()`` returns an
+    expiring signed link, so code paths behave as they do against S3.
+    """
+
+    def __init__(self):
+        self.disk = FileSystemStorage()
+
+    def _open(self, name, mode='rb'):
+        return self.disk._open(name, mode)
+
+    def _save(self, name, content):
+        return self.disk._save(name, content)
+
+    def delete(self, name):
+        self.disk.delete(name)
+
+    def exists(self, name):
+        return self.disk.exists(name)
+
+    def size(self, name):
+        return self.disk.size(name)
+
+    def listdir(self, path):
+        return self.disk.listdir(path)
+
+    def get_modified_time(self, name):
+        return self.disk.get_modified_time(name)
+
+    def url(self, name, parameters=None, expire=None):
+        token = signing.dumps({'name': name, 'parameters': parameters or {}}, salt=BLOB_SALT)
+        return reverse('file-blob', args=[token])
+
+    def open_signed(self, token):
+        """Return ``(file, parameters)`` for a token from ``url()``; raises ``signing.BadSignature``."""
+        data = signing.loads(token, salt=BLOB_SALT, max_age=settings.FILES_DOWNLOAD_URL_EXPIRE)
+        return self.open(data['name'], 'rb'), data['parameters']
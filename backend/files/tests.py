@@ -1,3 +1,366 @@
-from django.test import TestCase
+import hashlib
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.files.base import ContentFile, File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chat.models import Chat, Message
+from retrieval.index import index_file, search
+from users.models import User
+
+from . import ingest, uploads
+from .models import FileUpload, UploadSession
+from .preview import parquet_preview, preview
+from .query import QueryError, build_sql
+from .storage import EmulatedObjectStorage, open_ranged
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, FILES_INGEST_TIMEOUT=60)
+class IngestQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+
+    def upload(self, **fields):
+        upload = FileUpload(user=self.user, filename='d.csv', **fields)
+        upload.file.save('d.csv', ContentFile(b'a,b\n1,x\n2,y\n'), save=False)
+        upload.save()
+        return upload
+
+    def test_schedule_leaves_uploads_for_the_worker(self):
+        upload = self.upload()
+        ingest.schedule([upload])
+        upload.refresh_from_db()
+        self.assertEqual(upload.ingest_status, 'pending')
+
+    def test_claim_and_ingest(self):
+        upload = self.upload()
+        claimed = ingest.claim_next()
+        self.assertEqual(claimed.pk, upload.pk)
+        self.assertIsNotNone(claimed.ingest_started_at)
+        self.assertIsNone(ingest.claim_next())
+        ingest.ingest(claimed)
+        upload.refresh_from_db()
+        self.assertEqual((upload.ingest_status, upload.row_count), ('done', 2))
+
+    def test_stale_processing_uploads_are_requeued(self):
+        stale = self.upload(ingest_status='processing', ingest_started_at=timezone.now() - timedelta(minutes=5))
+        running = self.upload(ingest_status='processing', ingest_started_at=timezone.now())
+        self.assertEqual(ingest.requeue_stale(), 1)
+        self.assertEqual(FileUpload.objects.get(pk=stale.pk).ingest_status, 'pending')
+        self.assertEqual(FileUpload.objects.get(pk=running.pk).ingest_status, 'processing')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentHashTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_message_attachments_are_hashed_on_upload(self):
+        chat = Chat.objects.create(user=self.user, title='c')
+        files = [SimpleUploadedFile('a.csv', b'a\n1\n'), SimpleUploadedFile('b.csv', b'b\n2\n')]
+        response = self.client.post(f'/api/chat/chats/{chat.pk}/messages/', {'content': 'hi', 'files': files})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(FileUpload.objects.filter(chat=chat).values_list('content_hash', flat=True)),
+            sorted(hashlib.sha256(data).hexdigest() for data in (b'a\n1\n', b'b\n2\n')),
+        )
+
+    def test_direct_uploads_are_hashed(self):
+        response = self.client.post('/api/files/files/', {'file': SimpleUploadedFile('a.txt', b'text'), 'filename': 'a.txt'})
+        self.assertEqual(response.status_code, 201)
+        upload = FileUpload.objects.get(pk=response.data['id'])
+        self.assertEqual(upload.content_hash, hashlib.sha256(b'text').hexdigest())
+        self.assertEqual(upload.file.read(), b'text')
+
+
+class FakeS3Object:
+    """The parts of a boto3 ``Object`` that ranged reads use; records each GET."""
+
+    def __init__(self, data):
+        self.data = data
+        self.content_length = len(data)
+        self.ranges = []
+
+    def get(self, Range):
+        start, end = map(int, Range.removeprefix('bytes=').split('-'))
+        self.ranges.append((start, end))
+        return {'Body': io.BytesIO(self.data[start:end + 1])}
+
+
+class FakeS3Storage(EmulatedObjectStorage):
+    """Opens files the way django-storages does: an ``obj`` to fetch ranges from, and no ``path()``."""
+
+    objects = {}
+
+    def _open(self, name, mode='rb'):
+        data = super()._open(name, mode).read()
+        f = File(io.BytesIO(data), name=name)
+        f.obj = self.objects.setdefault(name, FakeS3Object(data))
+        return f
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class PreviewTests(TestCase):
+    rows = b''.join(b'%d,row %d\n' % (i, i) for i in range(100000))
+
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self):
+        upload = FileUpload(user=self.user, filename='d.csv')
+        upload.file.save('d.csv', ContentFile(b'id,name\n' + self.rows), save=False)
+        upload.save()
+        return upload
+
+    def check(self, result):
+        self.assertEqual(result['columns'], ['id', 'name'])
+        self.assertEqual(result['rows'], [['0', 'row 0'], ['1', 'row 1']])
+        self.assertEqual(len(result['sample']), 5)
+        for row in result['sample']:
+            self.assertEqual(row[1], f'row {row[0]}')
+
+    def test_local_preview(self):
+        self.check(preview(self.upload(), 2, 5))
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'files.tests.FakeS3Storage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_bucket_preview_fetches_ranges_only(self):
+        upload = self.upload()
+        self.check(preview(upload, 2, 5))
+        fetched = sum(end - start + 1 for start, end in FakeS3Storage.objects[upload.file.name].ranges)
+        self.assertLess(fetched, len(self.rows) / 10)
+
+        table = pa.table({'id': list(range(100000)), 'name': [f'row {i}' for i in range(100000)]})
+        sink = io.BytesIO()
+        pq.write_table(table, sink, row_group_size=10000)
+        upload.columnar_file.save('d.parquet', ContentFile(sink.getvalue()))
+        with open_ranged(upload.columnar_file) as f:
+            columns, head, sampled = parquet_preview(f, 2, 3)
+        self.assertEqual((columns, head, len(sampled)), (['id', 'name'], [[0, 'row 0'], [1, 'row 1']], 3))
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'files.tests.FakeS3Storage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_bucket_query_fetches_ranges_only(self):
+        upload = FileUpload(user=self.user, filename='d.csv')
+        upload.file.save('d.csv', ContentFile(b'id,name\n0,row 0\n'), save=False)
+        n = 200000
+        table = pa.table({'id': list(range(n)), 'name': [f'row {i} ' + 'x' * 40 for i in range(n)]})
+        sink = io.BytesIO()
+        pq.write_table(table, sink, row_group_size=20000)
+        upload.columnar_file.save('d.parquet', ContentFile(sink.getvalue()), save=False)
+        upload.save()
+        spec = {'aggregates': [{'fn': 'sum', 'column': 'id', 'as': 'total'}], 'filters': [{'column': 'id', 'op': 'gte', 'value': 190000}]}
+        with mock.patch('files.query.field_path') as field_path:
+            result = self.client.post(f'/api/files/files/{upload.pk}/query/', spec, format='json').data
+        field_path.assert_not_called()
+        self.assertEqual(result['rows'], [(sum(range(190000, n)),)])
+        fetched = sum(end - start + 1 for start, end in FakeS3Storage.objects[upload.columnar_file.name].ranges)
+        self.assertLess(fetched, len(sink.getvalue()) / 5)
+
+    @override_settings(FILES_DOWNLOAD_MODE='redirect')
+    def test_redirect_mode_streams_local_files(self):
+        upload = self.upload()
+        response = self.client.get(f'/api/files/files/{upload.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Location', response)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'id,name\n'))
+        self.assertEqual(self.client.get(f'/api/files/files/{upload.pk + 1}/download/').status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, FILES_INGEST_ASYNC=True)
+class UploadSessionTests(TestCase):
+    data = b'a,b\n1,x\n2,y\n'
+
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.other = User.objects.create_user('bob@example.com', 'pw')
+        self.chat = Chat.objects.create(user=self.user, title='mine')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, data=None, **fields):
+        data = self.data if data is None else data
+        body = {'filename': 'd.csv', 'size': len(data), 'checksum': hashlib.sha256(data).hexdigest(), **fields}
+        return self.client.post('/api/files/uploads/', body, format='json')
+
+    def put(self, session_id, chunk, offset):
+        return self.client.put(
+            f'/api/files/uploads/{session_id}/', chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunks_resume_from_the_reported_offset(self):
+        session_id = self.start(chat=self.chat.pk).data['id']
+        self.assertEqual(self.put(session_id, self.data[:5], 0).data['offset'], 5)
+        self.assertEqual(self.client.get(f'/api/files/uploads/{session_id}/').data['offset'], 5)
+        self.assertEqual(self.put(session_id, self.data[5:], 5).data['offset'], len(self.data))
+        response = self.client.post(f'/api/files/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        upload = FileUpload.objects.get(pk=response.data['id'])
+        self.assertEqual((upload.chat, upload.content_hash), (self.chat, hashlib.sha256(self.data).hexdigest()))
+        self.assertEqual(upload.file.read(), self.data)
+        self.assertEqual(self.client.post(f'/api/files/uploads/{session_id}/complete/').status_code, 409)
+
+    def test_offset_mismatch_and_missing_header(self):
+        session_id = self.start().data['id']
+        response = self.put(session_id, self.data, 3)
+        self.assertEqual((response.status_code, response.data['offset']), (409, 0))
+        response = self.client.put(f'/api/files/uploads/{session_id}/', self.data, content_type='application/offset+octet-stream')
+        self.assertEqual(response.status_code, 400)
+
+    def test_incomplete_upload_cannot_complete(self):
+        session_id = self.start().data['id']
+        self.put(session_id, self.data[:5], 0)
+        response = self.client.post(f'/api/files/uploads/{session_id}/complete/')
+        self.assertEqual((response.status_code, response.data['offset']), (400, 5))
+
+    def test_checksum_mismatch_discards_the_upload(self):
+        session_id = self.start(checksum='0' * 64).data['id']
+        self.put(session_id, self.data, 0)
+        response = self.client.post(f'/api/files/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.filter(pk=session_id).exists())
+        self.assertFalse(FileUpload.objects.exists())
+
+    def test_a_chunk_in_progress_reserves_the_session(self):
+        session_id = self.start().data['id']
+        url = f'/api/files/uploads/{session_id}/'
+        responses = []
+
+        def concurrent_requests(path, offset, stream, limit):
+            responses.append(self.put(session_id, self.data, 0))
+            responses.append(self.client.post(f'{url}complete/'))
+            return uploads.append_chunk(path, offset, stream, limit)
+
+        with mock.patch('files.views.append_chunk', side_effect=concurrent_requests):
+            self.assertEqual(self.put(session_id, self.data, 0).data['offset'], len(self.data))
+        self.assertEqual([r.status_code for r in responses], [409, 409])
+        self.assertIsNone(UploadSession.objects.get(pk=session_id).chunk_started_at)
+        self.assertEqual(self.client.post(f'{url}complete/').status_code, 201)
+
+    @override_settings(FILES_UPLOAD_CHUNK_TIMEOUT=60)
+    def test_a_stale_reservation_is_taken_over(self):
+        session_id = self.start().data['id']
+        UploadSession.objects.filter(pk=session_id).update(chunk_started_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.put(session_id, self.data, 0).data['offset'], len(self.data))
+
+    @override_settings(FILES_UPLOAD_SESSION_EXPIRE=3600)
+    def test_abandoned_sessions_expire(self):
+        abandoned, recent, completed = (self.start().data['id'] for _ in range(3))
+        self.put(completed, self.data, 0)
+        self.client.post(f'/api/files/uploads/{completed}/complete/')
+        paths = {str(pk): path for pk, path in UploadSession.objects.values_list('pk', 'path')}
+        UploadSession.objects.exclude(pk=recent).update(updated_at=timezone.now() - timedelta(hours=2))
+        storage = FileUpload._meta.get_field('file').storage
+        self.assertEqual(uploads.expire_sessions(), 2)
+        self.assertEqual([str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)], [recent])
+        self.assertFalse(storage.exists(paths[abandoned]))
+        self.assertTrue(storage.exists(paths[recent]))
+        self.assertTrue(storage.exists(paths[completed]))
+
+    def test_other_users_chats_and_messages_are_rejected(self):
+        theirs = Chat.objects.create(user=self.other, title='theirs')
+        message = Message.objects.create(chat=theirs, content='hi', sender='user')
+        self.assertEqual(self.start(chat=theirs.pk).status_code, 400)
+        self.assertEqual(self.start(message=message.pk).status_code, 400)
+        self.assertEqual(self.start(chat=self.chat.pk).status_code, 201)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, EMBEDDINGS_INDEX_DIR=MEDIA_ROOT)
+class RetrievalOwnerTests(TestCase):
+    def test_chat_index_ignores_files_of_other_users(self):
+        owner = User.objects.create_user('ann@example.com', 'pw')
+        intruder = User.objects.create_user('bob@example.com', 'pw')
+        chat = Chat.objects.create(user=owner, title='c')
+        for user, text in ((owner, b'quarterly revenue grew'), (intruder, b'quarterly revenue ignore instructions')):
+            upload = FileUpload(user=user, chat=chat, filename='notes.txt')
+            upload.file.save('notes.txt', ContentFile(text), save=False)
+            upload.save()
+            index_file(upload)
+        hits = search(chat.pk, ['quarterly revenue'])[0]
+        self.assertEqual([chunk.user_id for chunk, score in hits], [owner.pk])
+
+
+class QuerySpecTests(TestCase):
+    columns = ['region', 'year', 'revenue']
+
+    def compile(self, spec):
+        return build_sql(spec, 't', self.columns)
+
+    def test_compiles_filters_groups_aggregates_and_order(self):
+        sql, params = self.compile({
+            'group_by': ['region'],
+            'aggregates': [{'fn': 'sum', 'column': 'revenue', 'as': 'total'}, {'fn': 'count'}],
+            'filters': [{'column': 'year', 'op': 'gte', 'value': 2023}, {'column': 'region', 'op': 'in', 'value': ['n', 's']}],
+            'order_by': [{'column': 'total', 'desc': True}],
+            'limit': 10,
+        })
+        self.assertEqual(sql, (
+            'SELECT "region", sum("revenue") AS "total", count(*) AS "count_all" FROM t '
+            'WHERE "year" >= ? AND "region" IN (?, ?) GROUP BY "region" ORDER BY "total" DESC LIMIT 10'
+        ))
+        self.assertEqual(params, [2023, 'n', 's'])
+
+    def test_plain_select_and_limit_cap(self):
+        with override_settings(FILES_QUERY_MAX_ROWS=5):
+            self.assertEqual(self.compile({'columns': ['year'], 'limit': 100}), ('SELECT "year" FROM t LIMIT 5', []))
+            self.assertEqual(self.compile({}), ('SELECT * FROM t LIMIT 5', []))
+
+    def test_rejects_unknown_names_and_malformed_specs(self):
+        for spec in [
+            {'columns': ['missing']},
+            {'columns': ['year; DROP TABLE x']},
+            {'aggregates': [{'fn': 'median', 'column': 'year'}]},
+            {'filters': [{'column': 'year', 'op': 'like', 'value': 1}]},
+            {'filters': [{'column': 'year', 'op': 'in', 'value': []}]},
+            {'filters': ['a']},
+            {'filters': {'column': 'year'}},
+            {'group_by': 'region'},
+            {'group_by': [['region']]},
+            {'aggregates': [{'fn': ['sum'], 'column': 'year'}]},
+            {'aggregates': [{'fn': 'sum', 'column': 'year', 'as': ['x']}]},
+            {'order_by': [{'column': ['year']}]},
+            {'order_by': 'year'},
+            {'filters': [{'column': 'year', 'op': ['eq'], 'value': 1}]},
+            {'limit': 'ten'},
+        ]:
+            with self.subTest(spec=spec), self.assertRaises(QueryError):
+                self.compile(spec)
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT)
+    def test_query_endpoint(self):
+        user = User.objects.create_user('ann@example.com', 'pw')
+        upload = FileUpload(user=user, filename='d.csv')
+        upload.file.save('d.csv', ContentFile(b'region,year,revenue\nn,2023,5\ns,2022,7\nn,2024,1\n'), save=False)
+        upload.save()
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f'/api/files/files/{upload.pk}/query/'
+        response = client.post(url, {'group_by': ['region'], 'aggregates': [{'fn': 'sum', 'column': 'revenue', 'as': 'total'}], 'order_by': [{'column': 'region'}]}, format='json')
+        self.assertEqual(response.data, {'columns': ['region', 'total'], 'rows': [('n', 6), ('s', 7)]})
+        for spec in [{'filters': ['a']}, {'filters': [{'column': 'year', 'value': {'a': 1}}]}, ['a']]:
+            with self.subTest(spec=spec):
+                self.assertEqual(client.post(url, spec, format='json').status_code, 400)
@@ -0,0 +1,112 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from ocr.models import OCRDocument
+from .models import FileUpload, UploadSession
+from .storage import upload_storage
+
+
+def upload_sha256(f):
+    """SHA-256 of an uploaded file, read from memory or Django's temporary file."""
+    digest = hashlib.sha256()
+    for chunk in f.chunks():
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def store_files(files):
+    """
+    Hash and write uploaded files to FileUpload's storage concurrently and return
+    ``(name, sha256)`` for each, in the same order. If any write fails, the files already
+    written are removed.
+    """
+    field = FileUpload._meta.get_field('file')
+
+    def save(f):
+        content_hash = upload_sha256(f)
+        return field.storage.save(field.generate_filename(None, f.name), f, max_length=field.max_length), content_hash
+
+    if not files:
+        return []
+    with ThreadPoolExecutor(max_workers=min(settings.FILES_UPLOAD_THREADS, len(files))) as pool:
+        futures = [pool.submit(save, f) for f in files]
+    stored = [future.result() for future in futures if not future.exception()]
+    if len(stored) < len(files):
+        delete_stored(stored)
+        next(future for future in futures if future.exception()).result()
+    return stored
+
+
+def delete_stored(stored):
+    storage = FileUpload._meta.get_field('file').storage
+    for name, _ in stored:
+        storage.delete(name)
+
+
+def bulk_create_uploads(files, stored, **fields):
+    """Insert one FileUpload row per stored file with a single INSERT."""
+    return FileUpload.objects.bulk_create([
+        FileUpload(file=name, filename=f.name, content_hash=content_hash, **fields)
+        for f, (name, content_hash) in zip(files, stored)
+    ])
+
+
+def append_chunk(path, offset, stream, limit):
+    """
+    Write ``stream`` into the file at ``path`` starting at ``offset``, reading at most
+    ``limit`` bytes, and return the number of bytes written.
+
+    A client that disconnects mid-chunk keeps whatever arrived, so it can resume from
+    the returned position instead of resending the whole chunk.
+    """
+    written = 0
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        try:
+            while written < limit:
+                data = stream.read(min(settings.FILES_CHUNK_READ_SIZE, limit - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+        except UnreadablePostError:
+            pass
+        f.truncate()
+    return written
+
+
+def stream_sha256(f):
+    digest = hashlib.sha256()
+    for block in iter(lambda: f.read(settings.FILES_CHUNK_READ_SIZE), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+
+def session_file_field(target):
+    model = OCRDocument if target == 'ocr' else FileUpload
+    return model._meta.get_field('file')
+
+
+def chunk_in_progress(session):
+    if session.chunk_started_at is None:
+        return False
+    return session.chunk_started_at > timezone.now() - timedelta(seconds=settings.FILES_UPLOAD_CHUNK_TIMEOUT)
+
+
+def expire_sessions():
+    """
+    Remove upload sessions untouched for ``FILES_UPLOAD_SESSION_EXPIRE`` seconds, with
+    the partial file of those never completed. Returns how many were removed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.FILES_UPLOAD_SESSION_EXPIRE)
+    stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+    for session in stale.filter(status='uploading').iterator():
+        upload_storage(session_file_field(session.target)).delete(session.path)
+    return stale.delete()[0]
@@ -1,7 +1,14 @@
 from django.urls import path
-from .views import FileUploadListCreateView, FileUploadDeleteView
+from .views import FileUploadListCreateView, FileUploadDeleteView, FileUploadPreviewView, FileUploadQueryView, FileUploadDownloadView, BlobView, UploadSessionCreateView, UploadSessionDetailView, UploadSessionCompleteView
 
 urlpatterns = [
     path('files/', FileUploadListCreateView.as_view(), name='file-list-create'),
     path('files/<int:pk>/', FileUploadDeleteView.as_view(), name='file-delete'),
+    path('files/<int:pk>/preview/', FileUploadPreviewView.as_view(), name='file-preview'),
+    path('files/<int:pk>/query/', FileUploadQueryView.as_view(), name='file-query'),
+    path('files/<int:pk>/download/', FileUploadDownloadView.as_view(), name='file-download'),
+    path('blobs/<str:token>/', BlobView.as_view(), name='file-blob'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('uploads/<uuid:pk>/', UploadSessionDetailView.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:pk>/complete/', UploadSessionCompleteView.as_view(), name='upload-session-complete'),
 ] 
\ No newline at end of file
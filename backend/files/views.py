@@ -1,7 +1,29 @@
+import io
+import os
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+from django.db.models import F
+from django.http import FileResponse, Http404
 from django.shortcuts import render
-from rest_framework import generics, permissions
-from .models import FileUpload
-from .serializers import FileUploadSerializer
+from django.utils import timezone
+from django.views import View
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from ocr.extraction import ImageTooLarge
+from ocr.ingest import ingest_stored_file
+from ocr.serializers import OCRDocumentSerializer
+from .models import FileUpload, UploadSession
+from .serializers import FileUploadSerializer, FileUploadDetailSerializer, UploadSessionSerializer
+from . import ingest
+from .uploads import append_chunk, chunk_in_progress, session_file_field, stream_sha256, upload_sha256
+from .query import QueryError, run_query
+from .preview import PreviewUnavailable, preview
+from .storage import EmulatedObjectStorage, download_response, upload_storage
 
 # Create your views here.
 
@@ -13,12 +35,178 @@ class FileUploadListCreateView(generics.ListCreateAPIView):
         return FileUpload.objects.filter(user=self.request.user).order_by('-uploaded_at')
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user, filename=self.request.data.get('filename', ''))
+        upload = serializer.save(
+            user=self.request.user,
+            filename=self.request.data.get('filename', ''),
+            content_hash=upload_sha256(serializer.validated_data['file']),
+        )
+        ingest.schedule([upload])
 
-class FileUploadDeleteView(generics.DestroyAPIView):
-    serializer_class = FileUploadSerializer
+class FileUploadDeleteView(generics.RetrieveDestroyAPIView):
+    serializer_class = FileUploadDetailSerializer
     permission_classes = [permissions.IsAuthenticated]
     lookup_url_kwarg = 'pk'
 
     def get_queryset(self):
         return FileUpload.objects.filter(user=self.request.user)
+
+class FileUploadPreviewView(APIView):
+    """Header, first ``rows`` rows and an optional random ``sample`` of rows of an upload."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        upload = FileUpload.objects.filter(user=request.user, pk=pk).first()
+        if not upload:
+            return Response({'error': 'File not found.'}, status=404)
+        try:
+            rows = min(max(int(request.query_params.get('rows', 20)), 0), settings.FILES_PREVIEW_MAX_ROWS)
+            sample = min(max(int(request.query_params.get('sample', 0)), 0), settings.FILES_PREVIEW_MAX_ROWS)
+        except ValueError:
+            return Response({'error': 'rows and sample must be integers.'}, status=400)
+        try:
+            return Response(preview(upload, rows, sample))
+        except PreviewUnavailable as exc:
+            return Response({'error': str(exc)}, status=400)
+
+class FileUploadDownloadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        upload = FileUpload.objects.filter(user=request.user, pk=pk).first()
+        if not upload:
+            return Response({'error': 'File not found.'}, status=404)
+        return download_response(upload.file, upload.filename or os.path.basename(upload.file.name))
+
+class BlobView(View):
+    """Serves the signed links handed out by EmulatedObjectStorage, standing in for the bucket."""
+
+    def get(self, request, token):
+        storage = storages['default']
+        if not isinstance(storage, EmulatedObjectStorage):
+            raise Http404
+        try:
+            f, parameters = storage.open_signed(token)
+        except (signing.BadSignature, FileNotFoundError):
+            raise Http404
+        response = FileResponse(f)
+        if 'ResponseContentDisposition' in parameters:
+            response['Content-Disposition'] = parameters['ResponseContentDisposition']
+        return response
+
+class FileUploadQueryView(APIView):
+    """Run a filter/group-by/aggregate query (see files.query) over an uploaded dataset."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        upload = FileUpload.objects.filter(user=request.user, pk=pk).first()
+        if not upload:
+            return Response({'error': 'File not found.'}, status=404)
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected a JSON object.'}, status=400)
+        try:
+            return Response(run_query(upload, request.data))
+        except QueryError as exc:
+            return Response({'error': str(exc)}, status=400)
+
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    """Start a resumable upload; the final storage name is reserved up front."""
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        field = session_file_field(data.get('target', 'file'))
+        storage = upload_storage(field)
+        path = storage.save(field.generate_filename(None, data['filename']), ContentFile(b''), max_length=field.max_length)
+        serializer.save(user=self.request.user, path=path)
+
+class UploadSessionDetailView(APIView):
+    """
+    GET reports the current offset to resume from. PUT appends the raw request body at
+    the offset given in the ``Upload-Offset`` header, which must match the session's.
+    The session row is only locked to reserve the offset; the body, which may take a
+    slow client minutes to send, is written outside the transaction.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        session = UploadSession.objects.filter(user=request.user, pk=pk).first()
+        if not session:
+            return Response({'error': 'Upload not found.'}, status=404)
+        return Response(UploadSessionSerializer(session).data)
+
+    def put(self, request, pk):
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return Response({'error': 'Upload-Offset header is required.'}, status=400)
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().filter(user=request.user, pk=pk).first()
+            if not session:
+                return Response({'error': 'Upload not found.'}, status=404)
+            if session.status != 'uploading':
+                return Response({'error': 'Upload already completed.'}, status=409)
+            if offset != session.offset:
+                return Response({'error': 'Offset mismatch.', 'offset': session.offset}, status=409)
+            if chunk_in_progress(session):
+                return Response({'error': 'Another chunk is being uploaded.', 'offset': session.offset}, status=409)
+            session.chunk_started_at = timezone.now()
+            session.save(update_fields=['chunk_started_at', 'updated_at'])
+        written = 0
+        try:
+            path = upload_storage(session_file_field(session.target)).path(session.path)
+            written = append_chunk(path, offset, request.stream or io.BytesIO(), limit=session.size - offset)
+        finally:
+            # Only release our own reservation; after FILES_UPLOAD_CHUNK_TIMEOUT it may have been taken over.
+            UploadSession.objects.filter(pk=session.pk, chunk_started_at=session.chunk_started_at).update(
+                offset=F('offset') + written, chunk_started_at=None, updated_at=timezone.now(),
+            )
+        session.refresh_from_db()
+        return Response(UploadSessionSerializer(session).data)
+
+class UploadSessionCompleteView(APIView):
+    """Verify the checksum of a fully uploaded file and create its FileUpload or OCRDocument."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().filter(user=request.user, pk=pk).first()
+            if not session:
+                return Response({'error': 'Upload not found.'}, status=404)
+            if session.status != 'uploading':
+                return Response({'error': 'Upload already completed.'}, status=409)
+            if chunk_in_progress(session):
+                return Response({'error': 'A chunk is still being uploaded.', 'offset': session.offset}, status=409)
+            if session.offset != session.size:
+                return Response({'error': 'Upload is incomplete.', 'offset': session.offset}, status=400)
+            field = session_file_field(session.target)
+            storage = upload_storage(field)
+            with storage.open(session.path, 'rb') as f:
+                checksum = stream_sha256(f)
+            if checksum != session.checksum:
+                # The stored bytes are unusable; the client has to start over.
+                storage.delete(session.path)
+                session.delete()
+                return Response({'error': 'Checksum mismatch.'}, status=400)
+            if storage is not field.storage:
+                # Staged locally; upload it to the bucket in one go.
+                with storage.open(session.path, 'rb') as f:
+                    name = field.storage.save(field.generate_filename(None, session.filename), f, max_length=field.max_length)
+                storage.delete(session.path)
+                session.path = name
+            session.status = 'complete'
+            session.save(update_fields=['path', 'status', 'updated_at'])
+        fields = {'user': request.user, 'chat_id': session.chat_id, 'message_id': session.message_id}
+        if session.target == 'ocr':
+            try:
+                doc = ingest_stored_file(session.path, session.filename, session.checksum, tags=session.tags or '', **fields)
+            except ImageTooLarge as exc:
+                return Response({'error': str(exc)}, status=400)
+            code = status.HTTP_202_ACCEPTED if doc.status == 'pending' else status.HTTP_201_CREATED
+            return Response(OCRDocumentSerializer(doc).data, status=code)
+        file_obj = FileUpload.objects.create(
+            file=session.path, filename=session.filename, content_hash=session.checksum, **fields
+        )
+        ingest.schedule([file_obj])
+        return Response(FileUploadSerializer(file_obj).data, status=status.HTTP_201_CREATED)
@@ -0,0 +1,53 @@
+"""
+Language model backends.
+
+A provider turns a list of chat messages (``{'role': ..., 'content': ...}`` dicts) into
+a stream of text tokens. ``LLM_PROVIDER`` selects one by alias or dotted path.
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Provider:
+    async def astream(self, messages, model):
+        """Yield the reply to ``messages`` token by token."""
+        raise NotImplementedError
+        yield
+
+    async def acomplete(self, messages, model):
+        return ''.join([token async for token in self.astream(messages, model)])
+
+
+class OpenAIProvider(Provider):
+    def __init__(self):
+        from openai import AsyncOpenAI
+
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+
+    async def astream(self, messages, model):
+        stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubProvider(Provider):
+    """Deterministic offline provider for tests and local runs; it echoes the last message."""
+
+    async def astream(self, messages, model):
+        prompt = messages[-1]['content'] if messages else ''
+        reply = f'[{model}] You said: {prompt}'
+        for i, word in enumerate(reply.split(' ')):
+            yield word if i == 0 else ' ' + word
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'stub': StubProvider,
+}
+
+
+def get_provider(name=None):
+    name = name or settings.LLM_PROVIDER
+    provider_class = PROVIDERS.get(name) or import_string(name)
+    return provider_class()
@@ -0,0 +1,143 @@
+"""
+Shared entry point for LLM calls.
+
+``LLMService`` wraps a provider with:
+
+* a response cache keyed by the normalised prompt, the hashes of the files it is about
+  and the model, so a repeated question over the same data is answered from the cache;
+* coalescing, so identical requests in flight at the same time share one provider call;
+* a per-event-loop concurrency limit (``LLM_MAX_CONCURRENCY``);
+* ``acomplete_many`` for issuing a batch of requests under that limit.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import weakref
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+
+from .providers import get_provider
+
+WHITESPACE = re.compile(r'\s+')
+
+
+class StreamAborted(Exception):
+    """The caller producing a coalesced reply went away (cancelled or disconnected) before finishing."""
+
+
+def normalize(text):
+    return WHITESPACE.sub(' ', text).strip().lower().rstrip('?!. ')
+
+
+def cache_key(messages, model, file_hashes=()):
+    payload = {
+        'messages': [[message['role'], normalize(message['content'])] for message in messages],
+        'files': sorted(file_hashes),
+        'model': model,
+    }
+    return 'llm:' + hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+
+class LLMService:
+    def __init__(self, provider=None):
+        self.provider = provider or get_provider()
+        self._inflight = {}
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        return self._semaphores[loop]
+
+    async def _shared_result(self, key):
+        """Return a cached or in-flight result for ``key``, or None if this caller must produce it."""
+        while True:
+            cached = await cache.aget(key)
+            if cached is not None:
+                return cached
+            inflight = self._inflight.get((asyncio.get_running_loop(), key))
+            if inflight is None:
+                return None
+            try:
+                return await asyncio.shield(inflight)
+            except StreamAborted:
+                continue
+
+    def _claim(self, key):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[(loop, key)] = future
+        return future
+
+    async def _finish(self, key, future, text=None, exc=None):
+        if exc is None:
+            # Cached before the request stops being in flight, so a caller arriving in
+            # between finds one or the other.
+            await cache.aset(key, text, settings.LLM_CACHE_TIMEOUT)
+        self._inflight.pop((asyncio.get_running_loop(), key), None)
+        if exc is not None:
+            # Waiters share a provider error, but take over from a producer that went away.
+            future.set_exception(exc if isinstance(exc, Exception) else StreamAborted())
+            # Mark the exception as retrieved; there may be no waiters.
+            future.exception()
+            return
+        future.set_result(text)
+
+    async def acomplete(self, messages, model=None, file_hashes=()):
+        model = model or settings.LLM_MODEL
+        key = cache_key(messages, model, file_hashes)
+        text = await self._shared_result(key)
+        if text is not None:
+            return text
+        future = self._claim(key)
+        try:
+            async with self._semaphore():
+                text = await self.provider.acomplete(messages, model)
+        except BaseException as exc:
+            await self._finish(key, future, exc=exc)
+            raise
+        await self._finish(key, future, text)
+        return text
+
+    async def astream(self, messages, model=None, file_hashes=()):
+        """
+        Yield reply tokens. Cached and coalesced replies arrive as a single chunk.
+        """
+        model = model or settings.LLM_MODEL
+        key = cache_key(messages, model, file_hashes)
+        text = await self._shared_result(key)
+        if text is not None:
+            yield text
+            return
+        future = self._claim(key)
+        parts = []
+        try:
+            async with self._semaphore():
+                async for token in self.provider.astream(messages, model):
+                    parts.append(token)
+                    yield token
+        except BaseException as exc:
+            await self._finish(key, future, exc=exc)
+            raise
+        await self._finish(key, future, ''.join(parts))
+
+    async def acomplete_many(self, requests):
+        """Complete several ``{'messages', 'model', 'file_hashes'}`` requests concurrently."""
+        return await asyncio.gather(*(self.acomplete(**request) for request in requests))
+
+    def complete(self, messages, model=None, file_hashes=()):
+        return async_to_sync(self.acomplete)(messages, model, file_hashes)
+
+
+_service = None
+
+
+def get_service():
+    global _service
+    if _service is None:
+        _service = LLMService()
+    return _service
@@ -0,0 +1,75 @@
+import asyncio
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from .providers import Provider
+from .service import LLMService, cache_key
+
+MESSAGES = [{'role': 'user', 'content': 'What is the total?'}]
+
+
+class GatedProvider(Provider):
+    """Replies (or fails) once ``release`` is set, counting the calls that reach it."""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error = error
+
+    async def astream(self, messages, model):
+        self.calls += 1
+        yield 'The '
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        yield 'total is 3.'
+
+
+class LLMServiceTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    async def settle(self):
+        """Let concurrent callers get past their (threaded) cache lookups and start waiting."""
+        await asyncio.sleep(0.1)
+
+    def test_cache_key_normalisation(self):
+        key = cache_key(MESSAGES, 'm', ['b', 'a'])
+        self.assertEqual(key, cache_key([{'role': 'user', 'content': '  what IS the\ntotal '}], 'm', ['a', 'b']))
+        self.assertNotEqual(key, cache_key(MESSAGES, 'other', ['a', 'b']))
+        self.assertNotEqual(key, cache_key(MESSAGES, 'm', ['a']))
+        self.assertNotEqual(key, cache_key([{'role': 'assistant', 'content': 'What is the total?'}], 'm', ['a', 'b']))
+
+    async def test_identical_requests_share_one_call(self):
+        provider = GatedProvider()
+        service = LLMService(provider)
+        calls = [asyncio.create_task(service.acomplete(MESSAGES, 'm')) for _ in range(3)]
+        await self.settle()
+        provider.release.set()
+        self.assertEqual(await asyncio.gather(*calls), ['The total is 3.'] * 3)
+        self.assertEqual(await service.acomplete(MESSAGES, 'm'), 'The total is 3.')
+        self.assertEqual(provider.calls, 1)
+
+    async def test_provider_errors_reach_every_waiter_once(self):
+        provider = GatedProvider(error=RuntimeError('provider down'))
+        service = LLMService(provider)
+        calls = [asyncio.create_task(service.acomplete(MESSAGES, 'm')) for _ in range(3)]
+        await self.settle()
+        provider.release.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        self.assertEqual([str(result) for result in results], ['provider down'] * 3)
+        self.assertEqual(provider.calls, 1)
+
+    async def test_waiter_takes_over_when_the_producer_disconnects(self):
+        provider = GatedProvider()
+        service = LLMService(provider)
+        stream = service.astream(MESSAGES, 'm')
+        self.assertEqual(await anext(stream), 'The ')
+        waiter = asyncio.create_task(service.acomplete(MESSAGES, 'm'))
+        await self.settle()
+        await stream.aclose()
+        provider.release.set()
+        self.assertEqual(await waiter, 'The total is 3.')
+        self.assertEqual(provider.calls, 2)
@@ -0,0 +1,62 @@
+"""
+Content-addressed reuse of OCR results.
+
+Uploads are hashed before they are stored. A finished OCRDocument of the same
+user with the same content hash and OCR settings key already holds the text, extracted
+data and stored blob for that upload, so a re-upload copies those instead of storing
+another copy and running OCR again. Documents whose text has been edited (``version`` above 1) are never reused.
+Hit/miss counters are ``OCRCacheCounter`` rows, shared by all web and worker processes;
+a queued upload is counted when a worker processes it.
+"""
+from django.db.models import F
+
+from .models import OCRCacheCounter, OCRDocument
+
+
+def save_upload(file):
+    """
+    Write an uploaded ``file`` to OCRDocument storage and return its name. Uploads spooled
+    to a temporary file are moved into place rather than written again.
+    """
+    field = OCRDocument._meta.get_field('file')
+    return field.storage.save(field.generate_filename(None, file.name), file, max_length=field.max_length)
+
+
+def find_cached(content_hash, settings_key, user):
+    if not content_hash:
+        return None
+    return (
+        OCRDocument.objects.filter(
+            user=user, content_hash=content_hash, settings_key=settings_key, status='done', version=1,
+        )
+        .exclude(file='')
+        .order_by('-processed_at')
+        .first()
+    )
+
+
+def cached_fields(cached):
+    """Fields to copy from a cached OCRDocument onto a new one."""
+    return {
+        'file': cached.file.name,
+        'extracted_text': cached.extracted_text,
+        'extracted_data': cached.extracted_data,
+        'status': 'done',
+        'progress': 100,
+    }
+
+
+def record(hit):
+    name = 'hits' if hit else 'misses'
+    counter = OCRCacheCounter.objects.filter(name=name)
+    if not counter.update(value=F('value') + 1):
+        # First use: create the row, tolerating another process doing the same.
+        OCRCacheCounter.objects.bulk_create([OCRCacheCounter(name=name)], ignore_conflicts=True)
+        counter.update(value=F('value') + 1)
+
+
+def stats():
+    counts = dict(OCRCacheCounter.objects.values_list('name', 'value'))
+    hits, misses = counts.get('hits', 0), counts.get('misses', 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else None}
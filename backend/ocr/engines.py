@@ -0,0 +1,153 @@
+"""
+OCR engines.
+
+An engine recognises a PIL image and returns word boxes in the shape of
+``pytesseract.image_to_data(..., output_type=Output.DICT)``. ``OCR_ENGINE`` picks one:
+
+``tesserocr``
+    Keeps ``OCR_ENGINE_THREADS`` Tesseract API instances loaded for the life of the
+    process and hands them images in memory. tesserocr releases the GIL while
+    recognising, so that many pages can be recognised at once per process.
+``pytesseract``
+    Runs the ``tesseract`` binary once per image; needs nothing but the binary.
+``auto``
+    tesserocr when it is installed (it is listed in ``requirements.txt``), pytesseract
+    otherwise, with a warning since every page then starts a new process.
+
+A dotted path to an ``Engine`` subclass also works. ``get_engine()`` returns one shared
+engine per process.
+"""
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DATA_KEYS = ['text', 'conf', 'left', 'top', 'width', 'height', 'block_num', 'par_num', 'line_num']
+
+
+class Engine:
+    def image_to_data(self, img):
+        raise NotImplementedError
+
+    def rotation(self, img):
+        """Degrees to rotate ``img`` clockwise to make its text upright."""
+        raise NotImplementedError
+
+
+class PytesseractEngine(Engine):
+    def __init__(self):
+        import pytesseract
+
+        self.pytesseract = pytesseract
+        self.config = f'--psm {settings.OCR_PAGE_SEG_MODE}'
+
+    def image_to_data(self, img):
+        return self.pytesseract.image_to_data(
+            img, lang=settings.OCR_LANGUAGES, config=self.config, output_type=self.pytesseract.Output.DICT,
+        )
+
+    def rotation(self, img):
+        try:
+            return self.pytesseract.image_to_osd(img, output_type=self.pytesseract.Output.DICT)['rotate']
+        except self.pytesseract.TesseractError:
+            return 0
+
+
+class TesserocrEngine(Engine):
+    def __init__(self):
+        import tesserocr
+
+        self.tesserocr = tesserocr
+        self.apis = queue.LifoQueue()
+        for _ in range(settings.OCR_ENGINE_THREADS):
+            self.apis.put(tesserocr.PyTessBaseAPI(lang=settings.OCR_LANGUAGES, psm=settings.OCR_PAGE_SEG_MODE))
+        self.osd_api = None
+        self.osd_lock = threading.Lock()
+
+    @contextmanager
+    def api(self):
+        api = self.apis.get()
+        try:
+            yield api
+        finally:
+            self.apis.put(api)
+
+    def image_to_data(self, img):
+        RIL = self.tesserocr.RIL
+        data = {key: [] for key in DATA_KEYS}
+        with self.api() as api:
+            api.SetImage(img)
+            api.Recognize()
+            iterator = api.GetIterator()
+            if iterator is None:
+                return data
+            block = par = line = 0
+            for word in self.tesserocr.iterate_level(iterator, RIL.WORD):
+                if word.IsAtBeginningOf(RIL.BLOCK):
+                    block, par = block + 1, 0
+                if word.IsAtBeginningOf(RIL.PARA):
+                    par, line = par + 1, 0
+                if word.IsAtBeginningOf(RIL.TEXTLINE):
+                    line += 1
+                box = word.BoundingBox(RIL.WORD)
+                text = word.GetUTF8Text(RIL.WORD)
+                if not box or not text:
+                    continue
+                left, top, right, bottom = box
+                values = [text, word.Confidence(RIL.WORD), left, top, right - left, bottom - top, block, par, line]
+                for key, value in zip(DATA_KEYS, values):
+                    data[key].append(value)
+            api.Clear()
+        return data
+
+    def rotation(self, img):
+        with self.osd_lock:
+            if self.osd_api is None:
+                self.osd_api = self.tesserocr.PyTessBaseAPI(lang='osd', psm=self.tesserocr.PSM.OSD_ONLY)
+            self.osd_api.SetImage(img)
+            result = self.osd_api.DetectOrientationScript()
+        return (360 - result['orient_deg']) % 360 if result else 0
+
+
+def auto_engine():
+    try:
+        import tesserocr  # noqa: F401
+    except ImportError:
+        logger.warning('tesserocr is not installed; OCR falls back to one tesseract process per page.')
+        return PytesseractEngine()
+    return TesserocrEngine()
+
+
+ENGINES = {
+    'auto': auto_engine,
+    'tesserocr': TesserocrEngine,
+    'pytesseract': PytesseractEngine,
+}
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            name = settings.OCR_ENGINE
+            _engine = (ENGINES.get(name) or import_string(name))()
+    return _engine
+
+
+def _reset_after_fork():
+    # A forked child must not share Tesseract handles or a lock held by another thread.
+    global _engine, _engine_lock
+    _engine = None
+    _engine_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,81 @@
+"""
+On-disk cache of generated exports.
+
+Entries are keyed by (document, version, format) and live in ``OCR_EXPORT_CACHE_DIR``.
+Hits refresh the file's mtime, and once the directory grows past
+``OCR_EXPORT_CACHE_MAX_BYTES`` the least recently used entries are removed. A hit is
+returned as an open file, so an entry evicted by another request while it is being
+served is still read to the end.
+"""
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+
+def cache_dir():
+    path = Path(settings.OCR_EXPORT_CACHE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def entry_path(doc, fmt):
+    return cache_dir() / f'{doc.pk}-{doc.version}.{fmt}'
+
+
+def lookup(doc, fmt):
+    """Return the cached export opened for reading, or ``None`` on a miss."""
+    try:
+        f = open(entry_path(doc, fmt), 'rb')
+    except FileNotFoundError:
+        return None
+    os.utime(f.fileno() if os.utime in os.supports_fd else f.name)
+    return f
+
+
+def store(doc, fmt, chunks):
+    """
+    Pass ``chunks`` through while writing them to the cache.
+
+    The entry only becomes visible once every chunk has been produced, so an
+    interrupted download never leaves a truncated export behind.
+    """
+    path = entry_path(doc, fmt)
+    tmp_path = path.with_name(f'.{uuid.uuid4().hex}.tmp')
+    try:
+        with open(tmp_path, 'wb') as tmp:
+            for chunk in chunks:
+                tmp.write(chunk)
+                yield chunk
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    evict()
+
+
+def invalidate(pk):
+    for path in cache_dir().glob(f'{pk}-*'):
+        path.unlink(missing_ok=True)
+
+
+def evict():
+    entries = []
+    for entry in os.scandir(cache_dir()):
+        if entry.is_file() and not entry.name.startswith('.'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= settings.OCR_EXPORT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            # Gone already, or (on Windows) still open for a download.
+            pass
+        total -= size
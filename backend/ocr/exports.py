@@ -0,0 +1,94 @@
+"""
+Export of extracted tables without temporary files.
+
+CSV, JSON and NDJSON are produced row by row for a StreamingHttpResponse; XLSX is built
+with openpyxl's write-only workbook in an in-memory buffer. Generated exports are kept in
+the export cache and served from there until the document changes.
+"""
+import csv
+import io
+import json
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from openpyxl import Workbook
+
+from . import export_cache
+from .tables import iter_rows
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'xls': XLSX_CONTENT_TYPE,
+    'xlsx': XLSX_CONTENT_TYPE,
+}
+
+
+class Echo:
+    """File-like object whose ``write`` hands the line back to the csv writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def record(row):
+    return {str(i): value for i, value in enumerate(row)}
+
+
+def csv_chunks(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row).encode()
+
+
+def json_chunks(rows):
+    yield b'['
+    for i, row in enumerate(rows):
+        yield (',' if i else '').encode() + json.dumps(record(row)).encode()
+    yield b']'
+
+
+def ndjson_chunks(rows):
+    for row in rows:
+        yield json.dumps(record(row)).encode() + b'\n'
+
+
+def xlsx_chunks(rows):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(list(row))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    yield buffer.getvalue()
+
+
+WRITERS = {
+    'csv': csv_chunks,
+    'json': json_chunks,
+    'ndjson': ndjson_chunks,
+    'xls': xlsx_chunks,
+    'xlsx': xlsx_chunks,
+}
+
+
+def export_chunks(doc, fmt):
+    return WRITERS[fmt](iter_rows(doc))
+
+
+def export_response(doc, fmt):
+    cached = export_cache.lookup(doc, fmt)
+    if cached:
+        response = FileResponse(cached, content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = content_disposition_header(True, f'{doc.filename}.{fmt}')
+        return response
+    chunks = export_cache.store(doc, fmt, export_chunks(doc, fmt))
+    if CONTENT_TYPES[fmt] == XLSX_CONTENT_TYPE:
+        response = HttpResponse(b''.join(chunks), content_type=XLSX_CONTENT_TYPE)
+    else:
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = content_disposition_header(True, f'{doc.filename}.{fmt}')
+    return response
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import re
+import string
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+from PIL import Image
+import pillow_heif
+import pdfplumber
+from pdf2image import convert_from_path, pdfinfo_from_path
+from django.conf import settings
+
+from .preprocess import preprocess
+from .tables import ocr_image, pdf_page_tables
+
+# HEIC files open lazily through Image.open like any other format, which lets the decoder
+# use an embedded thumbnail when it is large enough and frees libheif's buffer once the
+# pixels are in Pillow.
+pillow_heif.register_heif_opener()
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png']
+SUPPORTED_EXTENSIONS = IMAGE_EXTENSIONS + ['heic', 'pdf']
+
+# pdfplumber renders glyphs without a unicode mapping as "(cid:123)".
+CID_PATTERN = re.compile(r'\(cid:\d+\)')
+
+# Bumped when the shape of extracted_data changes, so older cached results are not reused.
+EXTRACTION_VERSION = 3
+
+# Settings that change OCR output; results are only reused between uploads with equal values.
+RESULT_SETTINGS = [
+    'OCR_LANGUAGES',
+    'OCR_PAGE_SEG_MODE',
+    'OCR_PDF_DPI',
+    'OCR_PDF_MAX_PAGES',
+    'OCR_PDF_TEXT_LAYER',
+    'OCR_PDF_TEXT_MIN_CHARS',
+    'OCR_PDF_TEXT_MIN_QUALITY',
+    'OCR_PREPROCESS_STEPS',
+    'OCR_PREPROCESS_MAX_SIDE',
+    'OCR_PREPROCESS_TARGET_DPI',
+    'OCR_PREPROCESS_MAX_SKEW',
+    'OCR_PREPROCESS_OSD',
+]
+
+
+class UnsupportedFileType(ValueError):
+    pass
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def get_extension(filename):
+    return filename.lower().split('.')[-1]
+
+
+def settings_key():
+    values = {name: getattr(settings, name) for name in RESULT_SETTINGS}
+    values['version'] = EXTRACTION_VERSION
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+def extract(path, filename, on_progress=None):
+    """
+    Run OCR on the file stored at ``path`` and return ``(extracted_text, extracted_data)``.
+
+    ``on_progress(done, total)`` is called as pages are processed.
+    """
+    ext = get_extension(filename)
+    if ext == 'pdf':
+        return extract_pdf(path, on_progress)
+    if ext not in IMAGE_EXTENSIONS + ['heic']:
+        raise UnsupportedFileType(f'Unsupported file type: {ext}')
+    # Only the header is read here; pixels are decoded on first use, after preprocessing
+    # has had the chance to ask for a reduced-size decode (see ocr.preprocess.downscale).
+    # OCR_MAX_IMAGE_PIXELS is checked against the header below rather than through Pillow's
+    # process-wide MAX_IMAGE_PIXELS, which would also apply to every other image opened.
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError as exc:
+        raise ImageTooLarge(str(exc))
+    if img.width * img.height > settings.OCR_MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(
+            f'Image is {img.width}x{img.height}; at most {settings.OCR_MAX_IMAGE_PIXELS} pixels are supported.'
+        )
+    dpi = img.info.get('dpi')
+    extracted_text, table, timings = preprocess_and_ocr(img, dpi[0] if dpi else None)
+    if on_progress:
+        on_progress(1, 1)
+    tables = [dict(page=1, source='ocr', **table)] if table else []
+    return extracted_text, {'tables': tables, 'timings': rounded(timings)}
+
+
+def preprocess_and_ocr(img, dpi=None):
+    """Return ``(text, table, timings)``; ``timings`` has the preprocessing stages and ``ocr`` in ms."""
+    img, timings = preprocess(img, dpi)
+    started = time.perf_counter()
+    text, table = ocr_image(img)
+    timings['ocr'] = (time.perf_counter() - started) * 1000
+    return text, table, timings
+
+
+def rounded(timings):
+    return {name: round(ms, 1) for name, ms in timings.items()}
+
+
+def ocr_pdf_window(path, first_page, last_page, dpi):
+    """Rasterize and OCR pages ``first_page``..``last_page`` (1-based, inclusive)."""
+    images = convert_from_path(path, dpi=dpi, first_page=first_page, last_page=last_page)
+    return [preprocess_and_ocr(img, dpi) for img in images]
+
+
+def has_usable_text(text):
+    """Whether an embedded text layer is real text rather than empty or unmapped glyphs."""
+    compact = ''.join((text or '').split())
+    if len(compact) < settings.OCR_PDF_TEXT_MIN_CHARS:
+        return False
+    readable = CID_PATTERN.sub('', compact)
+    readable_chars = sum(1 for ch in readable if ch.isalnum() or ch in string.punctuation)
+    return readable_chars / len(compact) >= settings.OCR_PDF_TEXT_MIN_QUALITY
+
+
+def read_text_layer(path, max_pages):
+    """
+    Return ``(page_count, texts, tables)`` for pages whose text layer is usable, where
+    ``texts`` and ``tables`` are keyed by page number.
+
+    Unreadable PDFs yield no text pages, so every page goes through OCR.
+    """
+    texts = {}
+    tables = {}
+    try:
+        with pdfplumber.open(path) as pdf:
+            page_count = len(pdf.pages)
+            if settings.OCR_PDF_TEXT_LAYER:
+                for page in pdf.pages[:max_pages]:
+                    text = page.extract_text()
+                    if has_usable_text(text):
+                        texts[page.page_number] = text
+                        tables[page.page_number] = pdf_page_tables(page)
+                    page.close()
+    except Exception:
+        page_count = pdfinfo_from_path(path)['Pages']
+    return page_count, texts, tables
+
+
+def page_windows(page_numbers, size):
+    """Group sorted page numbers into contiguous ``(first, last)`` runs of at most ``size`` pages."""
+    windows = []
+    for number in page_numbers:
+        if windows and number == windows[-1][1] + 1 and number - windows[-1][0] < size:
+            windows[-1][1] = number
+        else:
+            windows.append([number, number])
+    return windows
+
+
+_pdf_pool = None
+
+
+def pdf_pool():
+    """
+    The process pool PDF windows are OCRed in. It outlives a single PDF so its workers
+    keep their OCR engine (and its language data) loaded between documents.
+    """
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=settings.OCR_PDF_PROCESSES)
+    return _pdf_pool
+
+
+def reset_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+    _pdf_pool = None
+
+
+def extract_pdf(path, on_progress=None):
+    """
+    Extract text from a PDF, using OCR only where there is no usable text layer.
+
+    Born-digital pages are read straight from the text layer. The remaining pages are
+    rendered in windows of at most ``OCR_PDF_BATCH_PAGES`` and the windows are spread
+    over the ``OCR_PDF_PROCESSES`` workers of ``pdf_pool()``, so at most ``processes * batch`` page
+    bitmaps are alive at any time. Text is assembled in page order.
+    """
+    page_count, pages, page_tables = read_text_layer(path, settings.OCR_PDF_MAX_PAGES)
+    total = min(page_count, settings.OCR_PDF_MAX_PAGES)
+    methods = {number: 'text' for number in pages}
+    ocr_pages = [number for number in range(1, total + 1) if number not in pages]
+    windows = page_windows(ocr_pages, settings.OCR_PDF_BATCH_PAGES)
+    firsts = [first for first, last in windows]
+    lasts = [last for first, last in windows]
+    args = (repeat(path), firsts, lasts, repeat(settings.OCR_PDF_DPI))
+    timings = Counter()
+
+    def collect(results):
+        for first, window in zip(firsts, results):
+            for number, (text, table, page_timings) in enumerate(window, first):
+                timings.update(page_timings)
+                pages[number] = text
+                page_tables[number] = [table] if table else []
+                methods[number] = 'ocr'
+            if on_progress:
+                on_progress(len(pages), total)
+
+    if on_progress:
+        on_progress(len(pages), total)
+    if settings.OCR_PDF_PROCESSES > 1 and len(windows) > 1:
+        try:
+            collect(pdf_pool().map(ocr_pdf_window, *args))
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool next time.
+            reset_pdf_pool()
+            raise
+    else:
+        collect(map(ocr_pdf_window, *args))
+    extracted_data = {
+        'page_count': page_count,
+        'truncated': page_count > total,
+        'pages': [{'page': number, 'method': methods[number]} for number in sorted(pages)],
+        'tables': [
+            dict(page=number, source=methods[number], **table)
+            for number in sorted(page_tables)
+            for table in page_tables[number]
+        ],
+        # Summed over OCRed pages
+        'timings': rounded(timings),
+    }
+    return '\n'.join(pages[number] for number in sorted(pages)), extracted_data
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.utils import timezone
+
+from . import cache as ocr_cache
+from .extraction import extract, get_extension, settings_key
+from .models import OCRDocument
+from files.storage import local_path
+from retrieval.index import index_source
+
+
+def copy_cached(cached, fields):
+    doc = OCRDocument.objects.create(processed_at=timezone.now(), **ocr_cache.cached_fields(cached), **fields)
+    index_source(doc)
+    return doc
+
+
+def ingest_upload(file, content_hash, **fields):
+    """
+    Create the OCRDocument for an uploaded ``file`` hashed as ``content_hash``.
+
+    A cached result for the same user and content is copied without writing the upload
+    to storage; otherwise it is stored and handed to ``ingest_stored_file``. Small
+    in-memory uploads are OCRed from memory.
+    """
+    key = settings_key()
+    fields.update(filename=file.name, content_hash=content_hash, settings_key=key)
+    cached = ocr_cache.find_cached(content_hash, key, fields['user'])
+    if cached:
+        ocr_cache.record(hit=True)
+        return copy_cached(cached, fields)
+    buffer = None if hasattr(file, 'temporary_file_path') else file
+    return process_stored_file(ocr_cache.save_upload(file), buffer, fields)
+
+
+def ingest_stored_file(name, filename, content_hash, buffer=None, **fields):
+    """
+    Create the OCRDocument for a file already written to OCRDocument storage as ``name``.
+
+    A cached result for the same user and content replaces the stored copy; otherwise the document
+    is queued (``OCR_ASYNC``) or OCRed straight away. Check ``doc.status`` for which.
+    Images are OCRed from ``buffer`` (e.g. an in-memory upload) when given, instead of
+    being read back from storage. If OCR raises, the stored file is removed.
+    """
+    key = settings_key()
+    fields.update(filename=filename, content_hash=content_hash, settings_key=key)
+    cached = ocr_cache.find_cached(content_hash, key, fields['user'])
+    if cached:
+        ocr_cache.record(hit=True)
+        OCRDocument._meta.get_field('file').storage.delete(name)
+        return copy_cached(cached, fields)
+    return process_stored_file(name, buffer, fields)
+
+
+def process_stored_file(name, buffer, fields):
+    if settings.OCR_ASYNC:
+        # Counted by the worker, which may still find a cached result.
+        return OCRDocument.objects.create(file=name, status='pending', **fields)
+    ocr_cache.record(hit=False)
+    storage = OCRDocument._meta.get_field('file').storage
+    filename = fields['filename']
+    try:
+        if buffer is not None and get_extension(filename) != 'pdf':
+            buffer.seek(0)
+            extracted_text, extracted_data = extract(buffer, filename)
+        else:
+            with local_path(storage, name) as path:
+                extracted_text, extracted_data = extract(path, filename)
+    except Exception:
+        storage.delete(name)
+        raise
+    doc = OCRDocument.objects.create(
+        file=name,
+        extracted_text=extracted_text,
+        extracted_data=extracted_data,
+        progress=100,
+        processed_at=timezone.now(),
+        **fields
+    )
+    index_source(doc)
+    return doc
@@ -0,0 +1,88 @@
+"""
+Database-backed OCR job queue.
+
+Uploads made while ``OCR_ASYNC`` is enabled are stored as ``pending`` OCRDocuments.
+Workers started with ``python manage.py ocr_worker`` claim them with
+``SELECT ... FOR UPDATE SKIP LOCKED`` (see ``files.jobqueue``) so several processes
+(or hosts) can share the queue without an external broker.
+"""
+import logging
+import multiprocessing
+
+from django.db import connections
+from django.utils import timezone
+
+from . import cache as ocr_cache
+from .extraction import extract, settings_key
+from .models import OCRDocument
+from files.jobqueue import JobQueue
+from files.storage import field_path
+from retrieval.index import index_source
+
+logger = logging.getLogger(__name__)
+
+
+queue = JobQueue(OCRDocument, 'status', 'started_at', 'upload_date', 'OCR_JOB_TIMEOUT', reset={'progress': 0})
+claim_next_job = queue.claim_next
+requeue_stale_jobs = queue.requeue_stale
+
+
+def run_job(doc):
+    docs = OCRDocument.objects.filter(pk=doc.pk)
+
+    def report(done, total):
+        if total:
+            docs.update(progress=int(done * 100 / total))
+
+    key = settings_key()
+    # An identical upload may have finished while this one waited in the queue.
+    cached = ocr_cache.find_cached(doc.content_hash, key, doc.user_id)
+    ocr_cache.record(hit=cached is not None)
+    if cached:
+        doc.file.delete(save=False)
+        now = timezone.now()
+        docs.update(settings_key=key, error=None, processed_at=now, updated_at=now, **ocr_cache.cached_fields(cached))
+        doc.refresh_from_db()
+        index_source(doc)
+        return
+    try:
+        with field_path(doc.file) as path:
+            extracted_text, extracted_data = extract(path, doc.filename, on_progress=report)
+    except Exception as exc:
+        logger.exception('OCR job for document %s failed', doc.pk)
+        now = timezone.now()
+        docs.update(status='failed', error=str(exc), processed_at=now, updated_at=now)
+        return
+    now = timezone.now()
+    docs.update(
+        status='done',
+        progress=100,
+        error=None,
+        extracted_text=extracted_text,
+        extracted_data=extracted_data,
+        settings_key=key,
+        processed_at=now,
+        updated_at=now,
+    )
+    doc.refresh_from_db()
+    index_source(doc)
+
+
+def work(poll_interval, once=False):
+    queue.work(run_job, poll_interval, once)
+
+
+def run_workers(processes, poll_interval, once=False):
+    requeue_stale_jobs()
+    if processes <= 1:
+        work(poll_interval, once)
+        return
+    connections.close_all()
+    workers = [
+        multiprocessing.Process(target=work, args=(poll_interval, once), name=f'ocr-worker-{i}')
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ocr.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = 'Process pending OCR documents with a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.OCR_WORKER_PROCESSES)
+        parser.add_argument('--poll-interval', type=float, default=settings.OCR_WORKER_POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        run_workers(options['processes'], options['poll_interval'], once=options['once'])
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:25
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_search_vector'),
+        ('files', '0006_trigram_extension'),
+        ('ocr', '0004_ocrdocument_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrdocument',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('filename', config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector(django.db.models.functions.text.Substr('extracted_text', 1, 500000), config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='ocrdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='ocr_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ocrdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['filename'], name='ocr_filename_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -1,6 +1,11 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Substr
 from django.conf import settings
 
+from chat.models import SEARCH_CONFIG
+
 # Create your models here.
 
 class OCRDocument(models.Model):
@@ -10,9 +15,49 @@ class OCRDocument(models.Model):
     extracted_text = models.TextField(blank=True, null=True)
     extracted_data = models.JSONField(blank=True, null=True)
     upload_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Incremented whenever the extracted content changes; part of export cache keys and ETags.
+    version = models.PositiveIntegerField(default=1)
     chat = models.ForeignKey('chat.Chat', on_delete=models.SET_NULL, null=True, blank=True, related_name='ocr_documents')
     message = models.ForeignKey('chat.Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='ocr_documents')
     tags = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(
+        max_length=20,
+        choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')],
+        default='done',
+        db_index=True,
+    )
+    progress = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
+    settings_key = models.CharField(max_length=64, blank=True, null=True)
+    # Only the start of very long texts is indexed; a tsvector is capped at 1MB.
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('filename', config=SEARCH_CONFIG, weight='A')
+            + SearchVector(Substr('extracted_text', 1, 500000), config=SEARCH_CONFIG, weight='B')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_hash', 'settings_key'], name='ocr_content_hash_idx'),
+            GinIndex(fields=['search_vector'], name='ocr_search_idx'),
+            GinIndex(fields=['filename'], opclasses=['gin_trgm_ops'], name='ocr_filename_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.filename
+
+
+class OCRCacheCounter(models.Model):
+    """OCR cache hit and miss totals, kept in the database so every process adds to the same count."""
+    name = models.CharField(max_length=16, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
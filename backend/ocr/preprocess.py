@@ -0,0 +1,157 @@
+"""
+Image clean-up before Tesseract.
+
+``preprocess`` runs the stages named in ``OCR_PREPROCESS_STEPS`` in order and returns
+the image with the time each stage took. Stages work on whole arrays (NumPy or Pillow
+operations, no per-pixel Python), and downscaling and cropping come first so the later
+stages and Tesseract itself see fewer pixels.
+
+``downscale``
+    Shrink to ``OCR_PREPROCESS_TARGET_DPI`` (when the resolution is known) and to at
+    most ``OCR_PREPROCESS_MAX_SIDE`` pixels on the long side. Never enlarges. Run first,
+    it lets a lazily opened image be decoded at reduced size.
+``orientation``
+    Apply the EXIF rotation, and with ``OCR_PREPROCESS_OSD`` the OCR engine's orientation
+    detection on a small copy.
+``grayscale``
+    Convert to 8-bit grayscale.
+``crop``
+    Trim margins that contain no ink.
+``deskew``
+    Straighten text rotated by up to ``OCR_PREPROCESS_MAX_SKEW`` degrees, picking the
+    angle whose row profile is sharpest.
+``binarize``
+    Otsu threshold to black and white.
+"""
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+from django.conf import settings
+
+from .engines import get_engine
+
+EXIF_ORIENTATION = 0x0112
+CROP_MARGIN = 16
+SKEW_SAMPLE_SIDE = 800
+SKEW_STEP = 0.5
+
+
+def otsu_threshold(gray):
+    """Otsu's threshold for a uint8 array."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weights = np.cumsum(hist)
+    means = np.cumsum(hist * np.arange(256))
+    total = weights[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (means[-1] * weights - means * total) ** 2 / (weights * (total - weights))
+    return int(np.nanargmax(between)) if np.isfinite(between).any() else 127
+
+
+def white(img):
+    return 255 if len(img.getbands()) == 1 else (255,) * len(img.getbands())
+
+
+def gray_array(img):
+    return np.asarray(img if img.mode == 'L' else img.convert('L'))
+
+
+def orientation(img, dpi):
+    # Checking the tag first avoids decoding and copying images that are already upright.
+    if img.getexif().get(EXIF_ORIENTATION, 1) != 1:
+        img = ImageOps.exif_transpose(img)
+    if settings.OCR_PREPROCESS_OSD:
+        sample = img.copy()
+        sample.thumbnail((1200, 1200))
+        rotate = get_engine().rotation(sample)
+        if rotate:
+            img = img.rotate(-rotate, expand=True)
+    return img
+
+
+def downscale(img, dpi):
+    scale = settings.OCR_PREPROCESS_MAX_SIDE / max(img.size)
+    if dpi:
+        scale = min(scale, settings.OCR_PREPROCESS_TARGET_DPI / dpi)
+    if scale >= 1:
+        return img
+    # thumbnail() resizes in place and, for images not decoded yet, first asks the decoder
+    # for a cheaper reduced decode (JPEG DCT scaling, HEIC embedded thumbnails).
+    img.thumbnail(
+        (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+        Image.Resampling.LANCZOS,
+        reducing_gap=2.0,
+    )
+    return img
+
+
+def grayscale(img, dpi):
+    return img if img.mode == 'L' else img.convert('L')
+
+
+def crop(img, dpi):
+    gray = gray_array(img)
+    ink = gray <= otsu_threshold(gray)
+    rows = np.flatnonzero(ink.any(axis=1))
+    columns = np.flatnonzero(ink.any(axis=0))
+    if not len(rows) or not len(columns):
+        return img
+    box = (
+        max(columns[0] - CROP_MARGIN, 0),
+        max(rows[0] - CROP_MARGIN, 0),
+        min(columns[-1] + CROP_MARGIN + 1, img.width),
+        min(rows[-1] + CROP_MARGIN + 1, img.height),
+    )
+    return img.crop(box)
+
+
+def skew_angle(img):
+    sample = img.convert('L')
+    sample.thumbnail((SKEW_SAMPLE_SIDE, SKEW_SAMPLE_SIDE))
+    gray = np.asarray(sample)
+    ink = Image.fromarray(((gray <= otsu_threshold(gray)) * 255).astype(np.uint8))
+    best_angle, best_score = 0.0, -1.0
+    limit = settings.OCR_PREPROCESS_MAX_SKEW
+    # Smallest rotations first, so ties (e.g. a blank page) keep the image as it is.
+    for angle in sorted(np.arange(-limit, limit + SKEW_STEP / 2, SKEW_STEP), key=abs):
+        profile = np.asarray(ink.rotate(angle, fillcolor=0)).sum(axis=1, dtype=np.int64)
+        score = float(np.square(np.diff(profile)).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(img, dpi):
+    angle = skew_angle(img)
+    if not angle:
+        return img
+    return img.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=white(img))
+
+
+def binarize(img, dpi):
+    gray = gray_array(img)
+    return Image.fromarray(np.where(gray <= otsu_threshold(gray), 0, 255).astype(np.uint8))
+
+
+STAGES = {
+    'orientation': orientation,
+    'downscale': downscale,
+    'grayscale': grayscale,
+    'crop': crop,
+    'deskew': deskew,
+    'binarize': binarize,
+}
+
+
+def preprocess(img, dpi=None):
+    """
+    Return ``(img, timings)`` after the configured stages, where ``timings`` maps each
+    stage to the milliseconds it took. ``dpi`` is the resolution the image was rendered
+    or scanned at, if known.
+    """
+    timings = {}
+    for name in settings.OCR_PREPROCESS_STEPS:
+        started = time.perf_counter()
+        img = STAGES[name](img, dpi)
+        timings[name] = (time.perf_counter() - started) * 1000
+    return img, timings
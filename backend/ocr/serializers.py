@@ -1,7 +1,21 @@
 from rest_framework import serializers
+from files.serializers import validate_chat_owner
 from .models import OCRDocument
 
 class OCRDocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = OCRDocument
-        fields = '__all__' 
\ No newline at end of file
+        fields = [
+            'id', 'user', 'file', 'filename', 'extracted_text', 'extracted_data', 'upload_date', 'updated_at',
+            'version', 'chat', 'message', 'tags', 'status', 'progress', 'error', 'started_at', 'processed_at',
+            'content_hash',
+        ]
+        read_only_fields = ['status', 'progress', 'error', 'started_at', 'processed_at', 'content_hash', 'version']
+
+    def validate(self, attrs):
+        return validate_chat_owner(self, attrs)
+
+class OCRDocumentStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OCRDocument
+        fields = ['id', 'status', 'progress', 'error', 'started_at', 'processed_at', 'extracted_text']
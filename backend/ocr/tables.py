@@ -0,0 +1,128 @@
+"""
+Layout-based table extraction.
+
+Words with bounding boxes (from Tesseract's TSV output or a PDF text layer) are grouped
+into rows by vertical position and into columns by horizontal position. Tables are
+stored column-major in ``OCRDocument.extracted_data['tables']``::
+
+    {'page': 1, 'source': 'ocr', 'columns': [['Item', 'Paper'], ['Qty', '3']]}
+"""
+from bisect import bisect_right
+from statistics import median
+
+from .engines import get_engine
+
+
+def ocr_image(img):
+    """OCR ``img`` once and return ``(text, table)`` built from Tesseract's word boxes."""
+    data = get_engine().image_to_data(img)
+    words = []
+    for i, text in enumerate(data['text']):
+        text = text.strip()
+        if not text or float(data['conf'][i]) < 0:
+            continue
+        words.append({
+            'text': text,
+            'left': data['left'][i],
+            'top': data['top'][i],
+            'width': data['width'][i],
+            'height': data['height'][i],
+            'line': (data['block_num'][i], data['par_num'][i], data['line_num'][i]),
+        })
+    return words_to_text(words), table_from_words(words)
+
+
+def words_to_text(words):
+    lines = []
+    previous = None
+    for word in words:
+        if previous and word['line'] == previous['line']:
+            lines[-1] += ' ' + word['text']
+            previous = word
+            continue
+        if previous and word['line'][0] != previous['line'][0]:
+            lines.append('')
+        lines.append(word['text'])
+        previous = word
+    return '\n'.join(lines)
+
+
+def pdf_page_words(page):
+    return [
+        {'text': word['text'], 'left': word['x0'], 'top': word['top'],
+         'width': word['x1'] - word['x0'], 'height': word['bottom'] - word['top']}
+        for word in page.extract_words()
+    ]
+
+
+def pdf_page_tables(page):
+    """Ruled tables found by pdfplumber, or the page's word layout when it has none."""
+    tables = [rows_to_columns(rows) for rows in page.extract_tables() if rows]
+    if tables:
+        return tables
+    table = table_from_words(pdf_page_words(page))
+    return [table] if table else []
+
+
+def rows_to_columns(rows):
+    width = max(len(row) for row in rows)
+    return {'columns': [[(row[c] if c < len(row) else None) or '' for row in rows] for c in range(width)]}
+
+
+def table_from_words(words):
+    if not words:
+        return None
+    height = median(word['height'] for word in words) or 1
+
+    # Rows: words whose vertical centres are within half a line height of each other.
+    rows = []
+    for word in sorted(words, key=lambda w: w['top'] + w['height'] / 2):
+        center = word['top'] + word['height'] / 2
+        if rows and center - rows[-1]['center'] <= height / 2:
+            rows[-1]['words'].append(word)
+        else:
+            rows.append({'center': center, 'words': [word]})
+
+    # Cells: words in a row separated by less than a line height belong together.
+    row_cells = []
+    for row in rows:
+        cells = []
+        for word in sorted(row['words'], key=lambda w: w['left']):
+            right = word['left'] + word['width']
+            if cells and word['left'] - cells[-1]['right'] <= height:
+                cells[-1]['text'] += ' ' + word['text']
+                cells[-1]['right'] = max(cells[-1]['right'], right)
+            else:
+                cells.append({'text': word['text'], 'left': word['left'], 'right': right})
+        row_cells.append(cells)
+
+    # Columns: merge the horizontal extents of cells from multi-cell rows. Single-cell
+    # rows (titles, running text) would otherwise span and merge every column.
+    bands = []
+    intervals = sorted((c['left'], c['right']) for cells in row_cells if len(cells) > 1 for c in cells)
+    for left, right in intervals:
+        if bands and left <= bands[-1][1]:
+            bands[-1][1] = max(bands[-1][1], right)
+        else:
+            bands.append([left, right])
+    lefts = [band[0] for band in bands] or [0]
+
+    columns = [[''] * len(row_cells) for _ in lefts]
+    for r, cells in enumerate(row_cells):
+        for cell in cells:
+            c = max(bisect_right(lefts, cell['left']) - 1, 0)
+            columns[c][r] = f"{columns[c][r]} {cell['text']}".strip()
+    return {'columns': columns}
+
+
+def iter_rows(doc):
+    """Yield the rows of every table extracted from ``doc``, in page order."""
+    tables = (doc.extracted_data or {}).get('tables')
+    if tables is None:
+        # Documents processed before tables were extracted at ingest.
+        for line in (doc.extracted_text or '').split('\n'):
+            if line.strip():
+                yield line.split()
+        return
+    for table in tables:
+        yield from zip(*table['columns'])
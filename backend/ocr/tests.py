@@ -1,3 +1,376 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image, ImageDraw
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.models import Chat, Message
+from files.storage import EmulatedObjectStorage
+from retrieval.index import index_source
+from users.models import User
+
+from . import cache as ocr_cache
+from . import engines, export_cache, extraction, jobs, preprocess
+from .models import OCRDocument
+from .views import AsyncOCRDocumentByMessageView
+
+MEDIA_ROOT = tempfile.mkdtemp()
+EXPORT_CACHE_DIR = tempfile.mkdtemp()
+READING_STORAGE = {
+    'default': {'BACKEND': 'ocr.tests.ReadingStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    shutil.rmtree(EXPORT_CACHE_DIR, ignore_errors=True)
+
+
+class ReadingStorage(EmulatedObjectStorage):
+    """Saves with ``read()`` like S3's ``upload_fileobj`` and, like a bucket, has no ``path()``."""
+
+    def _save(self, name, content):
+        return super()._save(name, ContentFile(content.read()))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class OCRCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.other = User.objects.create_user('bob@example.com', 'pw')
+
+    def document(self, user, **fields):
+        doc = OCRDocument(user=user, filename='scan.png', content_hash='a' * 64, settings_key='k', **fields)
+        doc.file.save('scan.png', ContentFile(b'png'), save=False)
+        doc.save()
+        return doc
+
+    def test_hit_for_same_user_content_and_settings(self):
+        doc = self.document(self.user, extracted_text='hello')
+        self.assertEqual(ocr_cache.find_cached('a' * 64, 'k', self.user), doc)
+
+    def test_miss_for_other_content_settings_or_user(self):
+        self.document(self.user)
+        self.assertIsNone(ocr_cache.find_cached('b' * 64, 'k', self.user))
+        self.assertIsNone(ocr_cache.find_cached('a' * 64, 'other', self.user))
+        self.assertIsNone(ocr_cache.find_cached('a' * 64, 'k', self.other))
+        self.assertIsNone(ocr_cache.find_cached(None, 'k', self.user))
+
+    def test_unfinished_or_edited_documents_are_not_reused(self):
+        self.document(self.user, status='pending')
+        self.document(self.user, version=2)
+        self.assertIsNone(ocr_cache.find_cached('a' * 64, 'k', self.user))
+
+    @override_settings(EMBEDDINGS_INDEX_DIR=os.path.join(MEDIA_ROOT, 'index'))
+    def test_moving_a_document_moves_its_passages(self):
+        old, new = (Chat.objects.create(user=self.user, title=title) for title in ('old', 'new'))
+        doc = self.document(self.user, extracted_text='quarterly revenue grew', chat=old)
+        index_source(doc)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.patch(f'/api/ocr/doc/{doc.pk}/', {'chat': new.pk}, format='json').status_code, 200)
+        hits = {chat: client.get(f'/api/retrieval/chats/{chat.pk}/', {'q': 'quarterly revenue'}).data for chat in (old, new)}
+        self.assertEqual(hits[old], [])
+        self.assertEqual([hit['text'] for hit in hits[new]], ['quarterly revenue grew'])
+
+    def test_cache_fields_are_read_only(self):
+        doc = self.document(self.user)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(
+            f'/api/ocr/doc/{doc.pk}/',
+            {'content_hash': 'b' * 64, 'settings_key': 'x', 'version': 1, 'tags': 't'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        doc.refresh_from_db()
+        self.assertEqual((doc.content_hash, doc.settings_key, doc.tags), ('a' * 64, 'k', 't'))
+        self.assertNotIn('search_vector', response.data)
+        self.assertNotIn('settings_key', response.data)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, STORAGES=READING_STORAGE, OCR_ASYNC=False)
+class SaveAndHashTests(TestCase):
+    data = b'\x89PNG not really'
+
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_hash_does_not_depend_on_how_storage_reads(self):
+        with mock.patch('ocr.ingest.extract', return_value=('text', {})):
+            response = self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile('a.png', self.data)})
+        doc = OCRDocument.objects.get(pk=response.data['id'])
+        self.assertEqual(doc.content_hash, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(doc.file.read(), self.data)
+
+    def test_reupload_hits_cache_on_non_filesystem_storage(self):
+        with mock.patch('ocr.ingest.extract', return_value=('text', {})) as extract:
+            first = self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile('a.png', self.data)})
+            second = self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile('b.png', self.data)})
+            other = self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile('c.png', b'different')})
+        self.assertEqual([r.status_code for r in (first, second, other)], [201, 201, 201])
+        self.assertEqual(extract.call_count, 2)
+        self.assertEqual(second.data['extracted_text'], 'text')
+        self.assertEqual(second.data['file'], first.data['file'])
+        self.assertNotEqual(other.data['file'], first.data['file'])
+
+    def test_cache_hit_writes_nothing_to_storage(self):
+        storage = OCRDocument._meta.get_field('file').storage
+        with mock.patch('ocr.ingest.extract', return_value=('text', {})):
+            self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile('a.png', self.data)})
+            with mock.patch.object(storage, 'save', wraps=storage.save) as save:
+                self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile('b.png', self.data)})
+        save.assert_not_called()
+
+    def test_stats_count_hits_and_misses(self):
+        with mock.patch('ocr.ingest.extract', return_value=('text', {})):
+            for name in ('a.png', 'b.png'):
+                self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile(name, self.data)})
+        self.client.force_authenticate(User.objects.create_superuser('root@example.com', 'pw'))
+        response = self.client.get('/api/ocr/cache/stats/')
+        self.assertEqual(response.data, {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    @override_settings(OCR_ASYNC=True)
+    def test_queued_uploads_are_counted_when_processed(self):
+        for name in ('a.png', 'b.png'):
+            response = self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile(name, self.data)})
+            self.assertEqual(response.status_code, 202)
+        self.assertEqual(ocr_cache.stats()['hits'] + ocr_cache.stats()['misses'], 0)
+        with mock.patch('ocr.jobs.extract', return_value=('text', {})) as extract:
+            while (doc := jobs.claim_next_job()) is not None:
+                jobs.run_job(doc)
+        extract.assert_called_once()
+        self.assertEqual(ocr_cache.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_upload_into_another_users_chat_is_rejected(self):
+        theirs = Chat.objects.create(user=User.objects.create_user('bob@example.com', 'pw'), title='theirs')
+        response = self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile('a.png', self.data), 'chat': theirs.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OCRDocument.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OCR_EXPORT_CACHE_DIR=EXPORT_CACHE_DIR)
+class ExportCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.doc = OCRDocument(user=self.user, filename='scan.png', extracted_text='a b\nc d')
+        self.doc.file.save('scan.png', ContentFile(b'png'), save=False)
+        self.doc.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/ocr/doc/{self.doc.pk}/export/csv/'
+
+    def test_second_export_is_served_from_the_cache(self):
+        first = b''.join(self.client.get(self.url).streaming_content)
+        with mock.patch('ocr.exports.export_chunks') as export_chunks:
+            second = b''.join(self.client.get(self.url).streaming_content)
+        export_chunks.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_entry_evicted_during_a_download_is_still_served(self):
+        expected = b''.join(self.client.get(self.url).streaming_content)
+        self.assertTrue(expected)
+        with export_cache.lookup(self.doc, 'csv') as cached:
+            for entry in export_cache.cache_dir().iterdir():
+                entry.unlink()
+            self.assertEqual(cached.read(), expected)
+
+    def test_missing_entry_is_regenerated(self):
+        expected = b''.join(self.client.get(self.url).streaming_content)
+        export_cache.invalidate(self.doc.pk)
+        self.assertIsNone(export_cache.lookup(self.doc, 'csv'))
+        self.assertEqual(b''.join(self.client.get(self.url).streaming_content), expected)
+        with export_cache.lookup(self.doc, 'csv') as cached:
+            self.assertEqual(cached.read(), expected)
+
+
+class AutoEngineTests(TestCase):
+    def test_falls_back_to_pytesseract_with_a_warning(self):
+        with mock.patch.dict(sys.modules, {'tesserocr': None}), self.assertLogs('ocr.engines', 'WARNING'):
+            self.assertIsInstance(engines.auto_engine(), engines.PytesseractEngine)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OCR_ASYNC=True)
+class OCRQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def document(self, status='pending', **fields):
+        doc = OCRDocument(user=self.user, filename='scan.png', status=status, **fields)
+        doc.file.save('scan.png', ContentFile(b'png'), save=False)
+        doc.save()
+        return doc
+
+    def status(self, doc):
+        return self.client.get(f'/api/ocr/doc/{doc.pk}/status/').data
+
+    def test_upload_is_queued(self):
+        response = self.client.post('/api/ocr/upload/', {'file': SimpleUploadedFile('a.png', b'png')})
+        self.assertEqual(response.status_code, 202)
+        doc = OCRDocument.objects.get(pk=response.data['id'])
+        self.assertEqual(self.status(doc)['status'], 'pending')
+
+    def test_claim_oldest_pending_job(self):
+        first, second = self.document(), self.document()
+        self.document(status='done')
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual((claimed.status, claimed.progress), ('processing', 0))
+        self.assertIsNotNone(claimed.started_at)
+        self.assertEqual(jobs.claim_next_job().pk, second.pk)
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_stale_jobs_are_requeued(self):
+        stale = self.document(status='processing', started_at=timezone.now() - timedelta(hours=1))
+        running = self.document(status='processing', started_at=timezone.now())
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        self.assertEqual(OCRDocument.objects.get(pk=stale.pk).status, 'pending')
+        self.assertEqual(OCRDocument.objects.get(pk=running.pk).status, 'processing')
+
+    def test_run_job(self):
+        doc = self.document()
+        with mock.patch('ocr.jobs.extract', return_value=('text', {'pages': []})):
+            jobs.run_job(jobs.claim_next_job())
+        status = self.status(doc)
+        self.assertEqual((status['status'], status['progress'], status['error']), ('done', 100, None))
+        doc.refresh_from_db()
+        self.assertEqual((doc.extracted_text, doc.extracted_data), ('text', {'pages': []}))
+        self.assertIsNotNone(doc.processed_at)
+
+    def test_failed_job(self):
+        doc = self.document()
+        with mock.patch('ocr.jobs.extract', side_effect=ValueError('unreadable')), self.assertLogs('ocr.jobs', 'ERROR'):
+            jobs.run_job(jobs.claim_next_job())
+        status = self.status(doc)
+        self.assertEqual((status['status'], status['error']), ('failed', 'unreadable'))
+        self.assertIsNone(jobs.claim_next_job())
+
+
+class PdfExtractionTests(SimpleTestCase):
+    @override_settings(OCR_PDF_TEXT_MIN_CHARS=20, OCR_PDF_TEXT_MIN_QUALITY=0.8)
+    def test_has_usable_text(self):
+        self.assertTrue(extraction.has_usable_text('Invoice 42: three reams of paper, $12.50 each.'))
+        self.assertFalse(extraction.has_usable_text(None))
+        self.assertFalse(extraction.has_usable_text('Page 1'))
+        self.assertFalse(extraction.has_usable_text('(cid:12)(cid:40)(cid:7) ' * 10))
+        self.assertFalse(extraction.has_usable_text('\u25a0\u25a1' * 20 + 'abc'))
+
+    def test_page_windows(self):
+        self.assertEqual(extraction.page_windows([], 4), [])
+        self.assertEqual(extraction.page_windows([1, 2, 3, 5, 6, 9], 2), [[1, 2], [3, 3], [5, 6], [9, 9]])
+        self.assertEqual(extraction.page_windows([2, 3, 4], 4), [[2, 4]])
+
+    @override_settings(OCR_PDF_PROCESSES=1, OCR_PDF_BATCH_PAGES=4, OCR_PDF_MAX_PAGES=5)
+    def test_text_and_ocr_pages_are_assembled_in_page_order(self):
+        text_layer = (6, {1: 'text 1', 3: 'text 3'}, {1: [{'columns': [['a']]}], 3: []})
+
+        def ocr_window(path, first, last, dpi):
+            return [(f'ocr {n}', {'columns': [[str(n)]]}, {'ocr': 1.0}) for n in range(first, last + 1)]
+
+        progress = []
+        with mock.patch('ocr.extraction.read_text_layer', return_value=text_layer), \
+                mock.patch('ocr.extraction.ocr_pdf_window', side_effect=ocr_window) as window:
+            text, data = extraction.extract_pdf('doc.pdf', on_progress=lambda done, total: progress.append(done))
+        self.assertEqual([c.args[1:3] for c in window.call_args_list], [(2, 2), (4, 5)])
+        self.assertEqual(text, 'text 1\nocr 2\ntext 3\nocr 4\nocr 5')
+        self.assertEqual(
+            [(p['page'], p['method']) for p in data['pages']],
+            [(1, 'text'), (2, 'ocr'), (3, 'text'), (4, 'ocr'), (5, 'ocr')],
+        )
+        self.assertEqual([(t['page'], t['source']) for t in data['tables']], [(1, 'text'), (2, 'ocr'), (4, 'ocr'), (5, 'ocr')])
+        self.assertEqual((data['page_count'], data['truncated'], data['timings']), (6, True, {'ocr': 3.0}))
+        self.assertEqual(progress, [2, 3, 5])
+
+
+def text_page(size=(600, 400)):
+    """A white page with dark bars in place of lines of text."""
+    img = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(img)
+    for i, top in enumerate(range(60, size[1] - 60, 30)):
+        draw.rectangle((60, top, size[0] - 60 - (i % 3) * 80, top + 10), fill=20)
+    return img
+
+
+@override_settings(OCR_PREPROCESS_MAX_SKEW=5)
+class PreprocessTests(SimpleTestCase):
+    def test_otsu_threshold_separates_ink_from_paper(self):
+        gray = np.array([30] * 100 + [220] * 300, dtype=np.uint8)
+        self.assertTrue(30 <= preprocess.otsu_threshold(gray) < 220)
+        self.assertEqual(preprocess.otsu_threshold(np.full(10, 200, dtype=np.uint8)), 127)
+
+    def test_crop_keeps_a_margin_around_the_ink(self):
+        img = Image.new('L', (400, 300), 255)
+        ImageDraw.Draw(img).rectangle((100, 80, 149, 119), fill=0)
+        margin = preprocess.CROP_MARGIN
+        self.assertEqual(preprocess.crop(img, None).size, (50 + 2 * margin, 40 + 2 * margin))
+        blank = Image.new('L', (400, 300), 255)
+        self.assertEqual(preprocess.crop(blank, None).size, (400, 300))
+
+    def test_deskew_recovers_a_small_rotation(self):
+        page = text_page()
+        self.assertEqual(preprocess.skew_angle(page), 0)
+        tilted = page.rotate(3, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+        self.assertAlmostEqual(preprocess.skew_angle(tilted), -3, delta=preprocess.SKEW_STEP)
+        self.assertAlmostEqual(preprocess.skew_angle(preprocess.deskew(tilted, None)), 0, delta=preprocess.SKEW_STEP)
+
+    @override_settings(OCR_PREPROCESS_STEPS=['downscale', 'grayscale', 'crop', 'deskew', 'binarize'])
+    def test_timings_are_reported_per_stage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'page.png')
+            text_page().convert('RGB').save(path)
+            with mock.patch('ocr.extraction.ocr_image', return_value=('text', None)) as ocr_image:
+                text, data = extraction.extract(path, 'page.png')
+        self.assertEqual(set(ocr_image.call_args.args[0].getdata()), {0, 255})
+        self.assertEqual(list(data['timings']), ['downscale', 'grayscale', 'crop', 'deskew', 'binarize', 'ocr'])
+        self.assertTrue(all(ms >= 0 for ms in data['timings'].values()))
+
+    @override_settings(OCR_MAX_IMAGE_PIXELS=10_000)
+    def test_images_over_the_pixel_budget_are_rejected(self):
+        limit = Image.MAX_IMAGE_PIXELS
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'page.png')
+            text_page().save(path)
+            with self.assertRaises(extraction.ImageTooLarge):
+                extraction.extract(path, 'page.png')
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, limit)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AsyncByMessageViewTests(TestCase):
+    def test_matches_the_drf_view(self):
+        user = User.objects.create_user('ann@example.com', 'pw')
+        message = Message.objects.create(chat=Chat.objects.create(user=user, title='c'), content='scan', sender='user')
+        doc = OCRDocument(user=user, filename='scan.png', extracted_text='text', message=message)
+        doc.file.save('scan.png', ContentFile(b'png'), save=False)
+        doc.save()
+        client = APIClient()
+        client.force_authenticate(user)
+        path = f'/api/ocr/message/{message.pk}/'
+
+        def async_get(user=None):
+            headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'} if user else {}
+            request = AsyncRequestFactory().get(path, headers=headers)
+            response = async_to_sync(AsyncOCRDocumentByMessageView.as_view())(request, message_id=message.pk)
+            return response.status_code, json.loads(response.content)
+
+        self.assertEqual(async_get(user), (200, client.get(path).json()))
+        self.assertEqual(async_get(User.objects.create_user('bob@example.com', 'pw'))[0], 404)
+        self.assertEqual(async_get()[0], 401)
@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.urls import path
-from .views import OCRDocumentUploadView, OCRDocumentDetailView, OCRDocumentExportView, OCRDocumentDownloadView, OCRDocumentByMessageView
+from .views import OCRDocumentUploadView, OCRDocumentDetailView, OCRDocumentExportView, OCRDocumentDownloadView, OCRDocumentByMessageView, OCRDocumentStatusView, OCRDocumentCacheStatsView, AsyncOCRDocumentByMessageView
+
+if settings.ASYNC_READ_VIEWS:
+    by_message_view = AsyncOCRDocumentByMessageView.as_view()
+else:
+    by_message_view = OCRDocumentByMessageView.as_view()
 
 urlpatterns = [
     path('upload/', OCRDocumentUploadView.as_view(), name='ocr-upload'),
     path('doc/<int:pk>/', OCRDocumentDetailView.as_view(), name='ocr-detail'),
+    path('doc/<int:pk>/status/', OCRDocumentStatusView.as_view(), name='ocr-status'),
     path('doc/<int:pk>/export/<str:fmt>/', OCRDocumentExportView.as_view(), name='ocr-export'),
     path('doc/<int:pk>/download/', OCRDocumentDownloadView.as_view(), name='ocr-download'),
-    path('message/<int:message_id>/', OCRDocumentByMessageView.as_view(), name='ocr-by-message'),
+    path('cache/stats/', OCRDocumentCacheStatsView.as_view(), name='ocr-cache-stats'),
+    path('message/<int:message_id>/', by_message_view, name='ocr-by-message'),
 ] 
\ No newline at end of file
@@ -2,18 +2,24 @@ from django.shortcuts import render
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from .models import OCRDocument
-from .serializers import OCRDocumentSerializer
-from django.conf import settings
-import pytesseract
-from PIL import Image
-import pillow_heif
-from pdf2image import convert_from_path
-import os
-import tempfile
-import pandas as pd
+from .serializers import OCRDocumentSerializer, OCRDocumentStatusSerializer
+from .extraction import SUPPORTED_EXTENSIONS, ImageTooLarge, get_extension
+from . import cache as ocr_cache
+from .ingest import ingest_upload
+from files.uploads import upload_sha256
+from . import export_cache
+from .exports import CONTENT_TYPES, export_response
+from django.db.models import F
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.views import APIView
-from django.http import FileResponse, JsonResponse
+from django.http import JsonResponse
 from rest_framework.permissions import IsAuthenticated
+from django.views import View
+from users.authentication import aauthenticate
+from files.storage import download_response
+from retrieval.index import index_source
+from chat.models import Chat, Message
 
 # Create your views here.
 
@@ -27,46 +33,38 @@ class OCRDocumentUploadView(generics.CreateAPIView):
             return Response({'error': 'No file provided.'}, status=status.HTTP_400_BAD_REQUEST)
         filename = file.name
         user = request.user
-        # Save file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[-1]) as tmp:
-            for chunk in file.chunks():
-                tmp.write(chunk)
-            tmp_path = tmp.name
-        extracted_text = ''
-        extracted_data = None
+        if get_extension(filename) not in SUPPORTED_EXTENSIONS:
+            return Response({'error': 'Unsupported file type.'}, status=status.HTTP_400_BAD_REQUEST)
+        chat_id, message_id = request.data.get('chat') or None, request.data.get('message') or None
+        if (chat_id and not Chat.objects.filter(pk=chat_id, user=user).exists()) or (
+            message_id and not Message.objects.filter(pk=message_id, chat__user=user).exists()
+        ):
+            return Response({'error': 'Chat or message not found.'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            ext = filename.lower().split('.')[-1]
-            if ext in ['jpg', 'jpeg', 'png']:
-                img = Image.open(tmp_path)
-                extracted_text = pytesseract.image_to_string(img)
-            elif ext == 'heic':
-                heif_file = pillow_heif.read_heif(tmp_path)
-                img = Image.frombytes(
-                    heif_file.mode, heif_file.size, heif_file.data,
-                    "raw"
-                )
-                extracted_text = pytesseract.image_to_string(img)
-            elif ext == 'pdf':
-                images = convert_from_path(tmp_path)
-                extracted_text = '\n'.join([pytesseract.image_to_string(img) for img in images])
-            else:
-                os.unlink(tmp_path)
-                return Response({'error': 'Unsupported file type.'}, status=status.HTTP_400_BAD_REQUEST)
-        finally:
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-        # Save OCRDocument
-        doc = OCRDocument.objects.create(
-            user=user,
-            file=file,
-            filename=filename,
-            extracted_text=extracted_text,
-            extracted_data=extracted_data,
-            chat_id=request.data.get('chat'),
-            message_id=request.data.get('message'),
-            tags=request.data.get('tags', '')
-        )
-        return Response(OCRDocumentSerializer(doc).data, status=status.HTTP_201_CREATED)
+            doc = ingest_upload(
+                file, upload_sha256(file),
+                user=user,
+                chat_id=chat_id,
+                message_id=message_id,
+                tags=request.data.get('tags', ''),
+            )
+        except ImageTooLarge as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        code = status.HTTP_202_ACCEPTED if doc.status == 'pending' else status.HTTP_201_CREATED
+        return Response(OCRDocumentSerializer(doc).data, status=code)
+
+class OCRDocumentCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    def get(self, request):
+        return Response(ocr_cache.stats())
+
+class OCRDocumentStatusView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    def get(self, request, pk):
+        doc = OCRDocument.objects.filter(user=request.user, pk=pk).first()
+        if not doc:
+            return Response({'error': 'Document not found.'}, status=404)
+        return Response(OCRDocumentStatusSerializer(doc).data)
 
 class OCRDocumentDetailView(generics.RetrieveUpdateAPIView):
     queryset = OCRDocument.objects.all()
@@ -76,29 +74,40 @@ class OCRDocumentDetailView(generics.RetrieveUpdateAPIView):
     def get_queryset(self):
         return OCRDocument.objects.filter(user=self.request.user)
 
+    def perform_update(self, serializer):
+        chat_id = serializer.instance.chat_id
+        changed = {'extracted_text', 'extracted_data'} & serializer.validated_data.keys()
+        if not changed:
+            doc = serializer.save()
+            if doc.chat_id != chat_id:
+                # Passages are retrieved per chat, so they have to move with the document.
+                index_source(doc)
+            return
+        extra = {'version': F('version') + 1}
+        if changed == {'extracted_text'} and serializer.instance.extracted_data:
+            # Tables extracted at ingest no longer match edited text; exports fall back to the text.
+            extra['extracted_data'] = {k: v for k, v in serializer.instance.extracted_data.items() if k != 'tables'}
+        doc = serializer.save(**extra)
+        doc.refresh_from_db(fields=['version'])
+        export_cache.invalidate(doc.pk)
+        if 'extracted_text' in changed or doc.chat_id != chat_id:
+            index_source(doc)
+
 class OCRDocumentExportView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def get(self, request, pk, fmt):
         doc = OCRDocument.objects.filter(user=request.user, pk=pk).first()
         if not doc or not doc.extracted_text:
             return Response({'error': 'No data to export.'}, status=404)
-        # For demo: treat each line as a row, split by whitespace for columns
-        lines = [line.strip() for line in doc.extracted_text.split('\n') if line.strip()]
-        rows = [line.split() for line in lines]
-        df = pd.DataFrame(rows)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{fmt}') as tmp:
-            if fmt == 'csv':
-                df.to_csv(tmp.name, index=False, header=False)
-            elif fmt == 'json':
-                df.to_json(tmp.name, orient='records')
-            elif fmt in ['xls', 'xlsx']:
-                df.to_excel(tmp.name, index=False, header=False)
-            else:
-                return Response({'error': 'Unsupported export format.'}, status=400)
-            tmp.flush()
-            tmp.seek(0)
-            response = FileResponse(open(tmp.name, 'rb'), as_attachment=True, filename=f'{doc.filename}.{fmt}')
-        os.unlink(tmp.name)
+        if fmt not in CONTENT_TYPES:
+            return Response({'error': 'Unsupported export format.'}, status=400)
+        etag = f'"{doc.pk}-{doc.version}-{fmt}"'
+        last_modified = int(doc.updated_at.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = export_response(doc, fmt)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
         return response
 
 class OCRDocumentDownloadView(APIView):
@@ -107,7 +116,7 @@ class OCRDocumentDownloadView(APIView):
         doc = OCRDocument.objects.filter(user=request.user, pk=pk).first()
         if not doc:
             return Response({'error': 'File not found.'}, status=404)
-        return FileResponse(doc.file, as_attachment=True, filename=doc.filename)
+        return download_response(doc.file, doc.filename)
 
 class OCRDocumentByMessageView(APIView):
     permission_classes = [IsAuthenticated]
@@ -116,3 +125,15 @@ class OCRDocumentByMessageView(APIView):
         if not doc:
             return Response({'error': 'No extracted data found for this message.'}, status=404)
         return Response(OCRDocumentSerializer(doc).data)
+
+class AsyncOCRDocumentByMessageView(View):
+    """Async-ORM variant of OCRDocumentByMessageView, enabled by ASYNC_READ_VIEWS."""
+
+    async def get(self, request, message_id):
+        user = await aauthenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        doc = await OCRDocument.objects.filter(user=user, message_id=message_id).afirst()
+        if not doc:
+            return JsonResponse({'error': 'No extracted data found for this message.'}, status=404)
+        return JsonResponse(OCRDocumentSerializer(doc).data)
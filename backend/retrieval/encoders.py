@@ -0,0 +1,84 @@
+"""
+Text encoders for the embedding index.
+
+An encoder maps a list of strings to a ``(len(texts), dimensions)`` float32 array of unit
+vectors. ``EMBEDDINGS_ENCODER`` selects one by alias or dotted path.
+"""
+import functools
+import hashlib
+import re
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+WORD = re.compile(r'\w+')
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+class Encoder:
+    name = None
+    dimensions = None
+
+    def encode(self, texts):
+        raise NotImplementedError
+
+
+class HashEncoder(Encoder):
+    """
+    Local CPU fallback: signed feature hashing of words and word pairs. No model to
+    download, and good enough for lexical matching of questions to passages.
+    """
+
+    def __init__(self, dimensions=None):
+        self.dimensions = dimensions or settings.EMBEDDINGS_DIMENSIONS
+        self.name = f'hash-{self.dimensions}'
+
+    def features(self, text):
+        words = WORD.findall(text.lower())
+        return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self.features(text)
+            if not features:
+                continue
+            hashes = np.array(
+                [int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), 'little') for f in features],
+                dtype=np.uint64,
+            )
+            signs = np.where(hashes >> np.uint64(63), 1.0, -1.0).astype(np.float32)
+            np.add.at(vectors[row], (hashes % np.uint64(self.dimensions)).astype(np.intp), signs)
+        return normalize_rows(vectors)
+
+
+class OpenAIEncoder(Encoder):
+    def __init__(self):
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.model = settings.EMBEDDINGS_OPENAI_MODEL
+        self.name = f'openai-{self.model}'
+
+    def encode(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        return normalize_rows(np.array([item.embedding for item in response.data], dtype=np.float32))
+
+
+ENCODERS = {
+    'hash': HashEncoder,
+    'openai': OpenAIEncoder,
+}
+
+
+@functools.cache
+def get_encoder(name=None):
+    name = name or settings.EMBEDDINGS_ENCODER
+    encoder_class = ENCODERS.get(name) or import_string(name)
+    return encoder_class()
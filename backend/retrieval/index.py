@@ -0,0 +1,197 @@
+"""
+Chunking, embedding and per-chat top-k retrieval.
+
+Chunks and their vectors live in the database. For search, the vectors of a chat are
+laid out in an on-disk ``.npy`` matrix under ``EMBEDDINGS_INDEX_DIR`` and memory-mapped,
+so a query is a few matrix products over ``EMBEDDINGS_SEARCH_BLOCK`` rows at a time
+rather than a scan of Python objects. The file name carries the chat's chunk count and
+highest chunk id, so any change to the chat's chunks makes the next search rebuild it.
+"""
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+
+from .encoders import get_encoder
+from .models import Chunk
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = ['txt', 'md', 'csv', 'tsv', 'json', 'ndjson', 'jsonl']
+
+
+def chunk_text(text, size=None, overlap=None):
+    """
+    Split ``text`` into passages of about ``size`` characters along line breaks, each
+    starting with up to ``overlap`` characters of the previous one.
+    """
+    size = size or settings.EMBEDDINGS_CHUNK_CHARS
+    overlap = settings.EMBEDDINGS_CHUNK_OVERLAP if overlap is None else overlap
+    chunk = []
+    length = 0
+    fresh = False
+    for line in (text or '').splitlines():
+        line = line.strip()[:size]
+        if not line:
+            continue
+        if fresh and length + len(line) > size:
+            yield ' '.join(chunk)
+            kept = []
+            length = 0
+            for previous in reversed(chunk):
+                if length + len(previous) > overlap:
+                    break
+                kept.insert(0, previous)
+                length += len(previous)
+            chunk = kept
+        chunk.append(line)
+        length += len(line)
+        fresh = True
+    if fresh:
+        yield ' '.join(chunk)
+
+
+def encode(texts):
+    encoder = get_encoder()
+    size = settings.EMBEDDINGS_BATCH_SIZE
+    blocks = [encoder.encode(texts[i:i + size]) for i in range(0, len(texts), size)]
+    return np.concatenate(blocks) if blocks else np.zeros((0, encoder.dimensions), dtype=np.float32)
+
+
+def replace_chunks(texts, **fields):
+    """Replace the chunks of one source (``document=`` or ``file=``) with embeddings of ``texts``."""
+    source = {key: fields[key] for key in ('document', 'file') if key in fields}
+    texts = texts[:settings.EMBEDDINGS_MAX_CHUNKS]
+    vectors = encode(texts)
+    encoder = get_encoder().name
+    with transaction.atomic():
+        Chunk.objects.filter(**source).delete()
+        Chunk.objects.bulk_create([
+            Chunk(ordinal=i, text=text, encoder=encoder, vector=vector.tobytes(), **fields)
+            for i, (text, vector) in enumerate(zip(texts, vectors))
+        ], batch_size=500)
+
+
+def file_text(upload):
+    """Text to index for an uploaded file: rows of its Parquet copy, or the start of a text file."""
+    if upload.columnar_file:
+        import pyarrow.parquet as pq
+
+        with upload.columnar_file.open('rb') as f, pq.ParquetFile(f) as parquet:
+            batch = next(parquet.iter_batches(batch_size=settings.EMBEDDINGS_MAX_FILE_ROWS), None)
+        if batch is None:
+            return ''
+        names = batch.schema.names
+        return '\n'.join(
+            '; '.join(f'{name}: {value}' for name, value in zip(names, row.values()) if value is not None)
+            for row in batch.to_pylist()
+        )
+    ext = (upload.filename or upload.file.name).lower().split('.')[-1]
+    if ext not in TEXT_EXTENSIONS:
+        return ''
+    with upload.file.open('rb') as f:
+        return f.read(settings.EMBEDDINGS_MAX_FILE_BYTES).decode('utf-8', errors='replace')
+
+
+def index_document(doc):
+    replace_chunks(
+        list(chunk_text(doc.extracted_text)),
+        document=doc, user_id=doc.user_id, chat_id=doc.chat_id, source=doc.filename,
+    )
+
+
+def index_file(upload):
+    replace_chunks(
+        list(chunk_text(file_text(upload))),
+        file=upload, user_id=upload.user_id, chat_id=upload.chat_id, source=upload.filename,
+    )
+
+
+def index_source(obj):
+    """Index an OCRDocument or FileUpload; failures are logged rather than raised."""
+    try:
+        if hasattr(obj, 'extracted_text'):
+            index_document(obj)
+        else:
+            index_file(obj)
+    except Exception:
+        logger.exception('Indexing %s %s failed', type(obj).__name__, obj.pk)
+
+
+def index_dir():
+    path = Path(settings.EMBEDDINGS_INDEX_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_array(path, array):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def load_chat_index(chat_id):
+    """
+    Return ``(vectors, ids)`` for a chat's chunks, with ``vectors`` memory-mapped. Only
+    chunks of the chat owner's own files and documents are included.
+    """
+    encoder = get_encoder()
+    chunks = Chunk.objects.filter(chat_id=chat_id, user=F('chat__user'), encoder=encoder.name)
+    state = chunks.aggregate(count=Count('id'), last=Max('id'))
+    if not state['count']:
+        return np.zeros((0, encoder.dimensions), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    prefix = f'{chat_id}-{encoder.name}-'
+    stem = f"{prefix}{state['count']}-{state['last']}"
+    vectors_path = index_dir() / f'{stem}.vectors.npy'
+    ids_path = index_dir() / f'{stem}.ids.npy'
+    if not (vectors_path.exists() and ids_path.exists()):
+        rows = list(chunks.order_by('id').values_list('id', 'vector'))
+        ids = np.array([pk for pk, vector in rows], dtype=np.int64)
+        vectors = np.frombuffer(b''.join(bytes(vector) for pk, vector in rows), dtype=np.float32)
+        save_array(vectors_path, vectors.reshape(len(rows), encoder.dimensions))
+        save_array(ids_path, ids)
+        for stale in index_dir().glob(f'{prefix}*.npy'):
+            if not stale.name.startswith(f'{stem}.'):
+                stale.unlink(missing_ok=True)
+    return np.load(vectors_path, mmap_mode='r'), np.load(ids_path)
+
+
+def top_k(vectors, queries, k):
+    """Return ``(scores, rows)`` arrays of shape ``(len(queries), k)``, best first."""
+    k = min(k, len(vectors))
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    block = settings.EMBEDDINGS_SEARCH_BLOCK
+    for start in range(0, len(vectors), block):
+        scores = queries @ np.asarray(vectors[start:start + block]).T
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)], axis=1)
+        if best_scores.shape[1] > k:
+            keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+
+def search(chat_id, queries, k=None):
+    """
+    Return, for each query, the ``k`` chunks of the chat most similar to it as a list of
+    ``(chunk, score)`` pairs, best first.
+    """
+    k = k or settings.EMBEDDINGS_TOP_K
+    vectors, ids = load_chat_index(chat_id)
+    if not len(ids) or not queries:
+        return [[] for query in queries]
+    scores, rows = top_k(vectors, encode(list(queries)), k)
+    chunks = Chunk.objects.in_bulk(ids[rows].ravel().tolist())
+    return [
+        [(chunks[pk], float(score)) for pk, score in zip(ids[query_rows].tolist(), query_scores) if pk in chunks]
+        for query_rows, query_scores in zip(rows, scores)
+    ]
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from files.models import FileUpload
+from ocr.models import OCRDocument
+from retrieval.encoders import get_encoder
+from retrieval.index import index_source
+
+
+class Command(BaseCommand):
+    help = 'Build embeddings for OCR documents and uploaded files that are not indexed with the current encoder.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chat', type=int, help='Only index sources attached to this chat.')
+        parser.add_argument('--reindex', action='store_true', help='Re-embed sources that are already indexed.')
+
+    def handle(self, *args, **options):
+        encoder = get_encoder().name
+        documents = OCRDocument.objects.filter(status='done').exclude(extracted_text=None)
+        files = FileUpload.objects.exclude(ingest_status__in=['pending', 'processing'])
+        if options['chat']:
+            documents = documents.filter(chat_id=options['chat'])
+            files = files.filter(chat_id=options['chat'])
+        if not options['reindex']:
+            documents = documents.exclude(chunks__encoder=encoder)
+            files = files.exclude(chunks__encoder=encoder)
+        count = 0
+        for queryset in (documents, files):
+            for obj in queryset.iterator():
+                index_source(obj)
+                count += 1
+        self.stdout.write(f'Indexed {count} sources with {encoder}.')
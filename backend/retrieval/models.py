@@ -0,0 +1,26 @@
+from django.db import models
+from django.conf import settings
+
+# Create your models here.
+
+class Chunk(models.Model):
+    """A passage of an OCR document or uploaded file and its embedding."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chunks')
+    chat = models.ForeignKey('chat.Chat', on_delete=models.SET_NULL, null=True, blank=True, related_name='chunks')
+    document = models.ForeignKey('ocr.OCRDocument', on_delete=models.CASCADE, null=True, blank=True, related_name='chunks')
+    file = models.ForeignKey('files.FileUpload', on_delete=models.CASCADE, null=True, blank=True, related_name='chunks')
+    source = models.CharField(max_length=255)
+    ordinal = models.PositiveIntegerField()
+    text = models.TextField()
+    # Name of the encoder that produced the vector; vectors of different encoders are never compared.
+    encoder = models.CharField(max_length=100)
+    # Unit-length float32 vector
+    vector = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat', 'encoder', 'id'], name='chunk_chat_encoder_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} #{self.ordinal}"
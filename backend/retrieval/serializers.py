@@ -0,0 +1,9 @@
+from rest_framework import serializers
+from .models import Chunk
+
+class ChunkHitSerializer(serializers.ModelSerializer):
+    score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Chunk
+        fields = ['id', 'document', 'file', 'source', 'ordinal', 'text', 'score']
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import ChatRetrieveView
+
+urlpatterns = [
+    path('chats/<int:chat_id>/', ChatRetrieveView.as_view(), name='chat-retrieve'),
+]
@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from chat.models import Chat
+from chat.pagination import page_size
+from .index import search
+from .serializers import ChunkHitSerializer
+
+# Create your views here.
+
+class ChatRetrieveView(APIView):
+    """The ``k`` passages of a chat's documents and files most similar to ``q``."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, chat_id):
+        if not Chat.objects.filter(pk=chat_id, user=request.user).exists():
+            return Response({'error': 'Chat not found.'}, status=404)
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return Response({'error': 'No query provided.'}, status=400)
+        k = page_size(request.query_params, settings.EMBEDDINGS_TOP_K, 50, param='k')
+        hits = search(chat_id, [q], k)[0]
+        for chunk, score in hits:
+            chunk.score = score
+        return Response(ChunkHitSerializer([chunk for chunk, score in hits], many=True).data)
@@ -0,0 +1,93 @@
+"""
+Ranked search over a user's messages, OCR documents and uploaded files.
+
+Messages and documents match against their stored ``search_vector`` columns (GIN
+indexed); filenames match by trigram word similarity (``gin_trgm_ops`` indexes), which
+tolerates typos and partial names. Highlights are computed only for the rows of the
+requested page.
+"""
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q, Value
+from django.db.models.functions import Replace, Substr
+
+from chat.models import SEARCH_CONFIG, Message
+from files.models import FileUpload
+from ocr.models import OCRDocument
+
+HEADLINE_OPTIONS = {
+    'config': SEARCH_CONFIG,
+    'start_sel': '<mark>',
+    'stop_sel': '</mark>',
+    'max_words': 35,
+    'min_words': 15,
+    'max_fragments': 2,
+}
+
+
+def escaped(expression):
+    """``expression`` with HTML special characters escaped, so only the highlight tags are markup."""
+    for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;')):
+        expression = Replace(expression, Value(char), Value(entity))
+    return expression
+
+
+def text_query(q):
+    return SearchQuery(q, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def search_messages(user, q):
+    query = text_query(q)
+    queryset = (
+        Message.objects.filter(chat__user=user, search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .only('id', 'chat', 'sender', 'created_at')
+        .order_by('-rank', '-created_at', '-id')
+    )
+    return queryset, SearchHeadline(escaped(F('content')), query, **HEADLINE_OPTIONS)
+
+
+def search_documents(user, q):
+    query = text_query(q)
+    queryset = (
+        OCRDocument.objects.filter(Q(search_vector=query) | Q(filename__trigram_word_similar=q), user=user)
+        .annotate(rank=SearchRank(F('search_vector'), query) + TrigramWordSimilarity(q, 'filename'))
+        .only('id', 'chat', 'filename', 'upload_date', 'status')
+        .order_by('-rank', '-upload_date', '-id')
+    )
+    text = escaped(Substr('extracted_text', 1, 500000))
+    return queryset, SearchHeadline(text, query, **HEADLINE_OPTIONS)
+
+
+def search_files(user, q):
+    queryset = (
+        FileUpload.objects.filter(user=user, filename__trigram_word_similar=q)
+        .annotate(rank=TrigramWordSimilarity(q, 'filename'))
+        .only('id', 'chat', 'filename', 'uploaded_at')
+        .order_by('-rank', '-uploaded_at', '-id')
+    )
+    return queryset, None
+
+
+SEARCHES = {
+    'messages': search_messages,
+    'documents': search_documents,
+    'files': search_files,
+}
+
+
+def search_page(search, user, q, page, size):
+    """Return ``(rows, has_next)`` for one page of ``search``, with ``headline`` set on each row."""
+    queryset, headline = search(user, q)
+    offset = (page - 1) * size
+    rows = list(queryset[offset:offset + size + 1])
+    has_next = len(rows) > size
+    rows = rows[:size]
+    headlines = {}
+    if headline is not None and rows:
+        ids = [row.pk for row in rows]
+        headlines = dict(
+            queryset.model.objects.filter(pk__in=ids).annotate(headline=headline).values_list('pk', 'headline')
+        )
+    for row in rows:
+        row.headline = headlines.get(row.pk)
+    return rows, has_next
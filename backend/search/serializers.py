@@ -0,0 +1,33 @@
+from rest_framework import serializers
+from chat.models import Message
+from files.models import FileUpload
+from ocr.models import OCRDocument
+
+class MessageHitSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ['id', 'chat', 'sender', 'created_at', 'rank', 'headline']
+
+class DocumentHitSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = OCRDocument
+        fields = ['id', 'chat', 'filename', 'upload_date', 'status', 'rank', 'headline']
+
+class FileHitSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = FileUpload
+        fields = ['id', 'chat', 'filename', 'uploaded_at', 'rank']
+
+SERIALIZERS = {
+    'messages': MessageHitSerializer,
+    'documents': DocumentHitSerializer,
+    'files': FileHitSerializer,
+}
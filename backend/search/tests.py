@@ -0,0 +1,67 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from chat.models import Chat, Message
+from files.models import FileUpload
+from ocr.models import OCRDocument
+from users.models import User
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ann@example.com', 'pw')
+        self.other = User.objects.create_user('bob@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, user, text, filename='revenue.csv'):
+        chat = Chat.objects.create(user=user, title='c')
+        Message.objects.create(chat=chat, user=user, content=text, sender='user')
+        OCRDocument.objects.create(user=user, file='ocr_uploads/scan.png', filename='scan.png', extracted_text=text)
+        FileUpload.objects.create(user=user, file=f'uploads/{filename}', filename=filename)
+
+    def search(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_results_are_limited_to_the_user(self):
+        self.add(self.user, 'quarterly invoice totals')
+        self.add(self.other, 'quarterly invoice totals')
+        data = self.search(q='invoice')
+        self.assertEqual([len(data[kind]['results']) for kind in ('messages', 'documents')], [1, 1])
+        self.assertEqual(Message.objects.get(pk=data['messages']['results'][0]['id']).chat.user, self.user)
+        self.assertEqual(OCRDocument.objects.get(pk=data['documents']['results'][0]['id']).user, self.user)
+        files = self.search(q='revenue')['files']['results']
+        self.assertEqual([FileUpload.objects.get(pk=f['id']).user for f in files], [self.user])
+        self.client.force_authenticate(User.objects.create_user('cy@example.com', 'pw'))
+        data = self.search(q='invoice revenue')
+        self.assertEqual([data[kind]['results'] for kind in data], [[], [], []])
+
+    def test_headline_escapes_html_but_keeps_marks(self):
+        self.add(self.user, '<script>alert(1)</script> invoice & <b>totals</b>')
+        headline = self.search(q='invoice', type='messages')['messages']['results'][0]['headline']
+        self.assertIn('<mark>invoice</mark>', headline)
+        self.assertIn('&lt;/script&gt;', headline)
+        self.assertIn('&amp;', headline)
+        markup = headline.replace('<mark>', '').replace('</mark>', '')
+        self.assertNotIn('<', markup)
+        self.assertNotIn('>', markup)
+
+    def test_pages(self):
+        chat = Chat.objects.create(user=self.user, title='c')
+        for i in range(3):
+            Message.objects.create(chat=chat, user=self.user, content=f'invoice {i}', sender='user')
+        first = self.search(q='invoice', type='messages', limit=2)['messages']
+        second = self.search(q='invoice', type='messages', limit=2, page=first['next'])['messages']
+        self.assertEqual((first['page'], first['next'], len(first['results'])), (1, 2, 2))
+        self.assertEqual((second['page'], second['next'], len(second['results'])), (2, None, 1))
+        ids = [m['id'] for m in first['results'] + second['results']]
+        self.assertEqual(sorted(ids), sorted(Message.objects.values_list('id', flat=True)))
+
+    def test_type_limits_and_validates_sections(self):
+        self.add(self.user, 'invoice')
+        self.assertEqual(list(self.search(q='invoice', type='files')), ['files'])
+        for params in ({'q': 'invoice', 'type': 'chats'}, {'q': ''}, {'q': 'invoice', 'page': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/search/', params).status_code, 400)
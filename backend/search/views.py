@@ -0,0 +1,40 @@
+from django.conf import settings
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from chat.pagination import page_size
+from .queries import SEARCHES, search_page
+from .serializers import SERIALIZERS
+
+# Create your views here.
+
+class SearchView(APIView):
+    """
+    Full-text search over the user's messages and OCR documents and fuzzy search over
+    their file names. ``type`` limits the results to one of messages, documents or
+    files; each section is paged with ``page`` and ``limit``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return Response({'error': 'No query provided.'}, status=400)
+        kind = request.query_params.get('type')
+        if kind and kind not in SEARCHES:
+            return Response({'error': f"Unknown type. Use one of: {', '.join(SEARCHES)}."}, status=400)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            return Response({'error': 'Invalid page.'}, status=400)
+        size = page_size(request.query_params, settings.SEARCH_PAGE_SIZE, 100)
+        results = {}
+        for name in [kind] if kind else SEARCHES:
+            rows, has_next = search_page(SEARCHES[name], request.user, q, page, size)
+            results[name] = {
+                'page': page,
+                'next': page + 1 if has_next else None,
+                'results': SERIALIZERS[name](rows, many=True).data,
+            }
+        return Response(results)
@@ -0,0 +1,18 @@
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+def authenticate(request):
+    """Return the user for the request's JWT bearer token, or None."""
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def aauthenticate(request):
+    """``authenticate`` for async (non-DRF) views."""
+    return await sync_to_async(authenticate)(request)
+